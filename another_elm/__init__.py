@@ -0,0 +1,11 @@
+"""The another-elm wrapper around the elm compiler.
+
+The `another-elm` launcher (installed by init.py) runs `cli.main`. Other
+tools can compile in-process with `compiler.run_elm`, which takes the same
+arguments as the command line and works in the current directory.
+
+The configuration of the install (where the std checkout is, the random
+suffix and the another-elm version) is read from the config.json init.py
+writes next to the customised package store, see `config`.
+
+"""
@@ -0,0 +1,59 @@
+import os
+import sys
+
+from . import config
+
+
+def main(args):
+    """Run the another-elm command line with args.
+
+    Each command imports only the modules it needs (when a compile is
+    forwarded to a daemon that is only the small `client` module) as the
+    imports are paid on every run.
+
+    """
+    if config.random_suffix is None or config.another_elm_version is None:
+        print(
+            f"another-elm: {config.config_file} is missing, "
+            "please run init.py",
+            file=sys.stderr)
+        return 1
+
+    elm = os.getenv('ELM', 'elm')
+
+    if args[:1] == ["daemon"]:
+        from .daemon import default_daemon_socket, serve_daemon
+
+        if len(args) > 1:
+            socket_path = args[1]
+        else:
+            socket_path = os.getenv('ANOTHER_ELM_DAEMON',
+                                    default_daemon_socket())
+        return serve_daemon(socket_path)
+
+    if args[:1] == ["watch"]:
+        from .watch import watch
+
+        return watch(elm, args[1:])
+
+    if args[:1] == ["gc"]:
+        from .commands import gc
+
+        return gc(args[1:])
+
+    if args[:1] == ["make-many"]:
+        from .commands import make_many
+
+        return make_many(elm, args[1:])
+
+    daemon_socket = os.getenv('ANOTHER_ELM_DAEMON')
+    if daemon_socket:
+        from .client import run_daemon_client
+
+        code = run_daemon_client(daemon_socket, args)
+        if code is not None:
+            return code
+
+    from .compiler import run_elm
+
+    return run_elm(elm, args)
@@ -0,0 +1,58 @@
+import json
+import os
+import socket
+import sys
+
+from .config import another_elm_version, random_suffix
+
+
+def run_daemon_client(socket_path, args):
+    """Ask the daemon at socket_path to run another-elm with args.
+
+    Returns None if there is no (suitable) daemon to ask. Once the daemon has
+    taken the request elm may be running, so if the daemon then goes away
+    without an exit status that is reported as an error rather than
+    compiling again.
+
+    """
+    request = json.dumps({
+        "args": args,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "random-suffix": random_suffix,
+        "another-elm-version": another_elm_version,
+    }).encode()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+            socket.send_fds(sock, [request], [0, 1, 2])
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            return None
+
+        chunks = []
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                chunks.append(data)
+        except OSError:
+            pass
+
+    try:
+        reply = json.loads(b''.join(chunks))
+    except json.JSONDecodeError:
+        reply = {}
+
+    if "exit" in reply:
+        return reply["exit"]
+    # A stale daemon declines the request without running anything.
+    if "error" in reply:
+        return None
+    print(
+        f"another-elm: the daemon at {socket_path} stopped before reporting "
+        "an exit status",
+        file=sys.stderr)
+    return 1
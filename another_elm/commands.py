@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .compiler import (Compiler, ElmStuff, StoreLock, collect_garbage,
+                       format_size, parse_size, read_manifest, run_elm)
+
+
+def gc(args):
+    parser = argparse.ArgumentParser(
+        prog="another-elm gc",
+        allow_abbrev=False,
+        description="Delete the least recently used package versions from "
+        "another-elm's ELM_HOME and the least recently used elm-stuff "
+        "directories of the projects until the rest fits within the budget.")
+    parser.add_argument('--budget',
+                        type=parse_size,
+                        default=os.getenv('ANOTHER_ELM_GC_BUDGET', '2G'),
+                        metavar="SIZE",
+                        help="Bytes to keep, with an optional K, M or G "
+                        "suffix (default: ANOTHER_ELM_GC_BUDGET or 2G)")
+    parser.add_argument('--dry-run',
+                        action='store_true',
+                        help="Print what would be deleted without deleting "
+                        "it")
+    parser.add_argument('projects',
+                        nargs='*',
+                        default=["."],
+                        metavar="PROJECT",
+                        help="Project directories whose elm-stuff to include "
+                        "(default: the current directory)")
+    options = parser.parse_intermixed_args(args)
+
+    freed = collect_garbage(options.budget,
+                            options.projects,
+                            dry_run=options.dry_run)
+    verb = "would free" if options.dry_run else "freed"
+    print(f"another-elm gc: {verb} {format_size(freed)}")
+    return 0
+
+
+def read_builds(options, make_args):
+    """List the projects to build as (project, directory, elm args)."""
+    builds = []
+    for spec in options.projects:
+        (project, _, entries) = spec.partition(":")
+        entries = entries.split(",") if entries else []
+        builds.append(
+            (project, Path(project).resolve(), ["make"] + entries + make_args))
+
+    if options.manifest is not None:
+        with open(options.manifest) as f:
+            manifest = json.load(f)
+        base_dir = options.manifest.resolve().parent
+        for entry in manifest:
+            project = entry["project"]
+            builds.append(
+                (project, base_dir / project, ["make"] +
+                 entry.get("entries", []) + entry.get("args", []) + make_args))
+
+    return builds
+
+
+def prepare_many(compiler, builds):
+    """Prepare the package store for every build up front.
+
+    This is what `Compiler.compile` would do at the start of each build, but
+    doing it once here means the builds never need the store lock
+    exclusively and can run side by side. Returns the manifest of the
+    packages root.
+
+    """
+    manifest = read_manifest(compiler.packages_root)
+    cwd = os.getcwd()
+    try:
+        for (_, directory, args) in builds:
+            try:
+                os.chdir(directory)
+            except OSError:
+                continue
+            if compiler.packages_ready(args, manifest):
+                continue
+            with ElmStuff(compiler.elm_version,
+                          compiler.packages_marker) as elm_stuff:
+                with StoreLock(compiler.store_lock_path) as store_lock:
+                    store_lock.exclusive()
+                    if not compiler.packages_ready(args):
+                        compiler.prepare_packages(args, elm_stuff, store_lock)
+            manifest = read_manifest(compiler.packages_root)
+    finally:
+        os.chdir(cwd)
+    return manifest
+
+
+def make_many(elm, args):
+    """Build many projects at once, each in a forked child.
+
+    The elm version, the customised package hashes and the package store
+    are checked once for all the builds rather than once per build. The
+    output of each build is captured and reported, with its exit code and
+    timings, as JSON.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="another-elm make-many",
+        allow_abbrev=False,
+        usage="%(prog)s [OPTIONS] [PROJECT[:ENTRY,...] ...] "
+        "[-- ELM_MAKE_ARGS ...]",
+        description="Build many projects in parallel. Arguments after -- "
+        "are passed on to every `elm make`.")
+    parser.add_argument('projects',
+                        nargs='*',
+                        metavar="PROJECT[:ENTRY,...]",
+                        help="Project directory and the entry files (relative "
+                        "to it) to build")
+    parser.add_argument('--manifest',
+                        type=Path,
+                        metavar="FILE",
+                        help="JSON list of the projects to build, each as "
+                        '{"project": DIR, "entries": [...], "args": [...]} '
+                        "with DIR relative to FILE")
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        metavar="N",
+                        help="Build N projects at a time (default: the "
+                        "number of CPUs, %(default)s)")
+    parser.add_argument('--report',
+                        type=Path,
+                        metavar="FILE",
+                        help="Write the JSON report to FILE instead of "
+                        "stdout")
+    make_args = []
+    if "--" in args:
+        (args, make_args) = (args[:args.index("--")],
+                             args[args.index("--") + 1:])
+    options = parser.parse_intermixed_args(args)
+
+    builds = read_builds(options, make_args)
+    if not builds:
+        parser.error("no projects to build")
+
+    start = time.perf_counter()
+    compiler = Compiler(elm)
+    kwargs = {
+        "elm_version": compiler.elm_version,
+        "custom_hashes": compiler.custom_hashes,
+        "manifest": prepare_many(compiler, builds),
+    }
+
+    results = [None] * len(builds)
+    running = {}
+    pending = list(enumerate(builds))
+    while pending or running:
+        while pending and len(running) < max(options.jobs, 1):
+            (index, (project, directory, build_args)) = pending.pop(0)
+            output = tempfile.TemporaryFile()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                os.dup2(output.fileno(), 1)
+                os.dup2(output.fileno(), 2)
+                try:
+                    os.chdir(directory)
+                    code = run_elm(elm, build_args, **kwargs)
+                except BaseException as e:
+                    print(f"another-elm make-many: {e!r}", file=sys.stderr)
+                    code = 1
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+            running[pid] = (index, time.perf_counter(), output)
+
+        (pid, status, usage) = os.wait4(-1, 0)
+        (index, build_start, output) = running.pop(pid)
+        with output:
+            output.seek(0)
+            text = output.read().decode(errors='replace')
+        (project, _, build_args) = builds[index]
+        code = os.waitstatus_to_exitcode(status)
+        seconds = time.perf_counter() - build_start
+        results[index] = {
+            "project": project,
+            "args": build_args[1:],
+            "exit": code,
+            "seconds": seconds,
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            "output": text,
+        }
+        status = "ok" if code == 0 else f"failed ({code})"
+        print(f"another-elm make-many: {project} {status} in {seconds:.1f}s",
+              file=sys.stderr)
+
+    report = {
+        "elm_version": compiler.elm_version,
+        "jobs": options.jobs,
+        "seconds": time.perf_counter() - start,
+        "results": results,
+    }
+    if options.report is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(options.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 0 if all(result["exit"] == 0 for result in results) else 1
@@ -0,0 +1,1684 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from .config import another_elm_version, data_dir, random_suffix
+
+customised_dir = Path(data_dir) / "packages"
+objects_dir = Path(data_dir) / "objects"
+
+stub_packages = {
+    'bytes',
+    'file',
+    'http',
+    'parser',
+    'random',
+    'regex',
+    'time',
+    'url',
+    'virtual-dom',
+}
+
+# The packages init.py customises from this checkout.
+custom_packages = [('elm', 'core'), ('elm', 'json'), ('elm', 'browser'),
+                   ('elm', 'html'), ('elm', 'svg'),
+                   ('elm-explorations', 'test'),
+                   ('elm-explorations', 'markdown')]
+
+# The versions of the customized and stubbed packages that are seeded into a
+# packages root (and listed in the registry.dat written for it) so that they
+# never need downloading, see `seed_packages`.
+known_versions = {
+    'elm/core': ['1.0.0', '1.0.1', '1.0.2', '1.0.3', '1.0.4', '1.0.5'],
+    'elm/json': ['1.0.0', '1.1.0', '1.1.1', '1.1.2', '1.1.3'],
+    'elm/browser': ['1.0.0', '1.0.1', '1.0.2'],
+    'elm/html': ['1.0.0'],
+    'elm/svg': ['1.0.0', '1.0.1'],
+    'elm-explorations/test': ['1.0.0', '1.1.0', '1.2.0', '1.2.1', '1.2.2'],
+    'elm-explorations/markdown': ['1.0.0'],
+    'elm/bytes': [f'1.0.{patch}' for patch in range(9)],
+    'elm/file': [f'1.0.{patch}' for patch in range(6)],
+    'elm/http': ['1.0.0', '2.0.0'],
+    'elm/parser': ['1.0.0', '1.1.0'],
+    'elm/random': ['1.0.0'],
+    'elm/regex': ['1.0.0'],
+    'elm/time': ['1.0.0'],
+    'elm/url': ['1.0.0'],
+    'elm/virtual-dom': ['1.0.0', '1.0.1', '1.0.2', '1.0.3'],
+}
+
+# Records the state of every stubbed or customized package version in a
+# packages root, see `read_manifest`.
+manifest_file = ".another-elm-manifest"
+
+# Next to the store lock of each package store, see `StoreLock`.
+readers_lock_file = "another-elm.readers"
+
+# Holds the generation the manifest records for a stubbed or customized
+# package version, see `record_package`.
+stamp_file = ".another-elm-stamp"
+
+# From linux/fs.h, asks the filesystem to share the extents of one file with
+# another (a reflink).
+FICLONE = 0x40049409
+
+STUB = "stub"
+CUSTOM = "custom"
+PRISTINE = "pristine"
+
+
+class Trace:
+    """Record the time spent in each phase of a run of another-elm.
+
+    Tracing is enabled by setting ANOTHER_ELM_TRACE to a file name. The wall
+    and CPU time (including that of child processes such as elm) of each
+    phase and the number of files and bytes it wrote are saved to the file as
+    chrome trace events (view them with chrome://tracing or
+    https://ui.perfetto.dev) and summarised in one line on stderr.
+
+    """
+    def __init__(self):
+        self.path = None
+        self.events = []
+        self.open_phases = []
+
+    def start(self, path):
+        self.path = Path(path) if path else None
+        self.events = []
+        self.open_phases = []
+
+    @staticmethod
+    def cpu_time():
+        times = os.times()
+        return (times.user + times.system + times.children_user +
+                times.children_system)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.path is None:
+            yield
+            return
+
+        counts = {"files": 0, "bytes": 0}
+        depth = len(self.open_phases)
+        self.open_phases.append(counts)
+        start = time.perf_counter()
+        start_cpu = self.cpu_time()
+        try:
+            yield
+        finally:
+            self.open_phases.pop()
+            self.events.append({
+                "name": name,
+                "cat": "another-elm",
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (time.perf_counter() - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": {
+                    "depth": depth,
+                    "cpu_ms": (self.cpu_time() - start_cpu) * 1e3,
+                    **counts,
+                },
+            })
+
+    def touched(self, size, files=1):
+        """Count files written (of total size bytes) by the open phases."""
+        for counts in self.open_phases:
+            counts["files"] += files
+            counts["bytes"] += size
+
+    def finish(self):
+        """Write the trace file and print the summary."""
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({"traceEvents": self.events}, f)
+        except OSError as e:
+            print(f"another-elm: could not write trace: {e}", file=sys.stderr)
+
+        phases = {}
+        for event in self.events:
+            if event["args"]["depth"] == 1:
+                phases[event["name"]] = (phases.get(event["name"], 0) +
+                                         event["dur"] / 1e3)
+        breakdown = ", ".join(
+            f"{name} {ms:.1f}ms"
+            for (name, ms) in sorted(phases.items(), key=lambda p: -p[1]))
+        for event in self.events:
+            if event["args"]["depth"] == 0:
+                args = event["args"]
+                print(
+                    f"another-elm trace: {event['name']} "
+                    f"{event['dur'] / 1e3:.1f}ms wall, "
+                    f"{args['cpu_ms']:.1f}ms cpu, {args['files']} files, "
+                    f"{args['bytes']} bytes ({breakdown}) -> {self.path}",
+                    file=sys.stderr)
+
+
+trace = Trace()
+
+
+def read_manifest(packages_root):
+    """Read the manifest of a packages root.
+
+    The manifest is a json object with the keys:
+
+    * "packages": maps "author/package/version" to an entry recording the
+      "state" of that package version ("stub" or "custom"), the "hash" of its
+      contents, the "suffix" it was built for and the "generation" written to
+      the stamp file in the package directory (so that we notice if the
+      directory is deleted and recreated, by the compiler re-downloading the
+      package for example).
+    * "complete": true once all packages have been stubbed or customized for
+      the another-elm install given by "random-suffix" and
+      "another-elm-version" and the customised packages with the hashes in
+      "custom-packages".
+
+    Package versions without an entry are pristine.
+
+    """
+    try:
+        with open(packages_root / manifest_file) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+
+    if not isinstance(manifest.get("packages"), dict):
+        manifest["packages"] = {}
+    return manifest
+
+
+def write_manifest(packages_root, manifest):
+    manifest_path = packages_root / manifest_file
+    tmp_path = manifest_path.with_name(f"{manifest_file}.{os.getpid()}")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def package_state(manifest, name, version_entry):
+    """Return the state of the package version in `version_entry`.
+
+    `version_entry` is the `os.DirEntry` for the package version directory.
+
+    """
+    entry = manifest["packages"].get(f"{name}/{version_entry.name}")
+    if entry is None or entry.get("generation") != read_stamp(
+            Path(version_entry.path)):
+        return (PRISTINE, None)
+    return (entry.get("state", PRISTINE), entry)
+
+
+def read_stamp(package_root):
+    try:
+        with open(package_root / stamp_file) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def record_package(manifest, name, version, package_root, state, hash):
+    """Record the state of a package version we just stubbed or customized.
+
+    A new generation is written to the stamp file in the package directory.
+    A directory that is deleted and recreated (even if it gets the same inode
+    back) has no stamp and so is seen as pristine.
+
+    """
+    generation = os.urandom(16).hex()
+    with open(package_root / stamp_file, 'w') as f:
+        f.write(generation)
+    manifest["packages"][f"{name}/{version}"] = {
+        "state": state,
+        "hash": hash,
+        "suffix": random_suffix,
+        "generation": generation,
+    }
+
+
+def scan_versions(packages_root, manifest, author, package):
+    """List the versions of a package and forget removed versions."""
+    name = f"{author}/{package}"
+    try:
+        versions = list(os.scandir(packages_root / author / package))
+    except FileNotFoundError:
+        versions = []
+
+    present = {f"{name}/{v.name}" for v in versions}
+    for key in list(manifest["packages"]):
+        if key.startswith(f"{name}/") and key not in present:
+            del manifest["packages"][key]
+
+    return versions
+
+
+def hash_bytes(*contents):
+    h = hashlib.sha256()
+    for content in contents:
+        h.update(content)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def replace_with_stub(packages_root, manifest, author, package):
+    name = f"{author}/{package}"
+    for version_entry in scan_versions(packages_root, manifest, author,
+                                       package):
+        (state, entry) = package_state(manifest, name, version_entry)
+        if state == STUB and entry.get("suffix") == random_suffix:
+            continue
+
+        v = version_entry.name
+        package_root = Path(version_entry.path)
+        src_dir = package_root / "src"
+        elm_json_path = package_root / "elm.json"
+
+        # Derived from the suffix so that the stubs are reproducible.
+        dummy_module = "P{}".format(
+            hash_bytes(random_suffix.encode(), f"{name}/{v}".encode())[:32])
+        dummy_path = (src_dir / dummy_module).with_suffix(".elm")
+
+        dummy_source = """module {} exposing (..)
+
+a = 2
+""".format(dummy_module)
+        elm_json = json.dumps(
+            {
+                "type": "package",
+                "name": name,
+                "summary": "Encode and decode JSON values",
+                "license": "BSD-3-Clause",
+                "version": str(v),
+                "exposed-modules": [dummy_module],
+                "elm-version": "0.19.0 <= v < 0.20.0",
+                "dependencies": {
+                    "elm/core": "1.0.0 <= v < 2.0.0"
+                },
+                "test-dependencies": {}
+            },
+            indent=4)
+
+        shutil.rmtree(package_root)
+        os.makedirs(src_dir)
+
+        with open(dummy_path, 'w') as f:
+            f.write(dummy_source)
+
+        with open(elm_json_path, 'w') as f:
+            f.write(elm_json)
+        trace.touched(len(dummy_source) + len(elm_json), files=2)
+
+        record_package(
+            manifest,
+            name,
+            v,
+            package_root,
+            STUB,
+            hash_bytes(elm_json.encode(), dummy_source.encode()),
+        )
+
+
+def read_elm_json_dependencies(elm_json_path):
+    """Return every package an application pins in its elm.json.
+
+    Returns None for packages (which only give version ranges) and for
+    elm.json files that cannot be read.
+
+    """
+    try:
+        with open(elm_json_path) as f:
+            elm_json = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if elm_json.get("type") != "application":
+        return None
+
+    dependencies = {}
+    try:
+        for key in ("dependencies", "test-dependencies"):
+            for kind in ("direct", "indirect"):
+                dependencies.update(elm_json[key][kind])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    return dependencies
+
+
+def read_source_directories(elm_json_path):
+    with open(elm_json_path) as f:
+        elm_json = json.load(f)
+    if elm_json.get("type") == "package":
+        return [Path("src")]
+    return [Path(d) for d in elm_json.get("source-directories", [])]
+
+
+def store_is_warm(packages_root, elm_json_path, custom_hashes, manifest=None):
+    """Can we compile without priming and customizing the packages?
+
+    This is the case when a previous run of this exact another-elm install
+    finished customizing the packages and every package the project depends
+    on is already downloaded (so the compiler will not fetch a pristine
+    package behind our back) and still stubbed or customized. For a package
+    project that means every version elm could pick for each of its
+    dependencies.
+
+    `manifest` can be given if the manifest of the packages root has already
+    been read.
+
+    """
+    if manifest is None:
+        manifest = read_manifest(packages_root)
+    if not manifest.get("complete") or (
+            manifest.get("random-suffix") != random_suffix) or (
+                manifest.get("another-elm-version") != another_elm_version):
+        return False
+
+    # init.py can update the customised packages without changing the suffix.
+    if manifest.get("custom-packages") != custom_hashes:
+        return False
+
+    if not (packages_root / "registry.dat").exists():
+        return False
+
+    dependencies = read_elm_json_dependencies(elm_json_path)
+    if dependencies is None:
+        constraints = read_package_constraints(elm_json_path)
+        return constraints is not None and all(
+            package_present(packages_root, name, version)
+            for (name, constraint) in constraints.items()
+            for version in candidate_versions(name, constraint))
+
+    return all(
+        package_present(packages_root, name, version)
+        for (name, version) in dependencies.items())
+
+
+def package_present(packages_root, name, version):
+    """Is the package version there, stubbed or customized if it should be?
+
+    Only stubbed and customized package versions have a stamp file, one that
+    has been deleted and recreated does not.
+
+    """
+    package_root = packages_root / name / version
+    if name in known_versions:
+        return (package_root / stamp_file).is_file()
+    return package_root.is_dir()
+
+
+def read_package_constraints(elm_json_path):
+    """Return the version constraint of every dependency of a package.
+
+    Returns None for applications and for elm.json files that cannot be
+    read.
+
+    """
+    try:
+        with open(elm_json_path) as f:
+            elm_json = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if elm_json.get("type") != "package":
+        return None
+
+    constraints = {}
+    try:
+        for key in ("dependencies", "test-dependencies"):
+            constraints.update(elm_json[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    return constraints
+
+
+def candidate_versions(name, constraint):
+    """The versions elm may pick for a package's dependency on name.
+
+    Only the versions of the packages another-elm seeds (see
+    `known_versions`) are known, so for other packages (or constraints we
+    cannot parse) a version that never exists is returned: the store is
+    then never warm and the package is prepared by a priming compile.
+
+    """
+    unknown = ["0.0.0-unknown"]
+    parts = constraint.split()
+    if (name not in known_versions or len(parts) != 5 or parts[2] != "v"
+            or parts[1] not in ("<", "<=") or parts[3] not in ("<", "<=")):
+        return unknown
+    (lower, upper) = (parse_version(parts[0]), parse_version(parts[4]))
+    if lower is None or upper is None:
+        return unknown
+
+    def in_range(version):
+        version = parse_version(version)
+        return ((lower <= version if parts[1] == "<=" else lower < version) and
+                (version <= upper if parts[3] == "<=" else version < upper))
+
+    return [v for v in known_versions[name] if in_range(v)] or unknown
+
+
+def parse_version(version):
+    """Parse "major.minor.patch", returns None for anything else."""
+    parts = version.split(".")
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    return tuple(map(int, parts))
+
+
+def scan_packages(packages_root):
+    """List the (name, version) of every package version in packages_root."""
+    found = []
+    if not packages_root.is_dir():
+        return found
+    for author in os.scandir(packages_root):
+        if not author.is_dir():
+            continue
+        for package in os.scandir(author.path):
+            if not package.is_dir():
+                continue
+            for version in os.scandir(package.path):
+                if version.is_dir() and parse_version(version.name):
+                    found.append(
+                        (f"{author.name}/{package.name}", version.name))
+    return found
+
+
+def read_registry(path):
+    """Read the registry.dat elm keeps in a packages root.
+
+    The registry is the number of package versions elm has seen (it asks the
+    package server for the versions published since) followed by a map from
+    each package name to its newest version and the previous versions, in
+    the encoding of haskell's Data.Binary: big endian Int64 counts, a name as
+    two strings of a Word8 length and the bytes and a version as three Word8
+    (or 255 then three Word16 if a part does not fit).
+
+    Returns (count, {name: [version tuple]}) or None if there is no readable
+    registry.
+
+    """
+    def read(fmt):
+        size = struct.calcsize(fmt)
+        data = f.read(size)
+        if len(data) != size:
+            raise ValueError("registry.dat is truncated")
+        return struct.unpack(fmt, data)
+
+    def read_string():
+        (length, ) = read(">B")
+        return f.read(length).decode()
+
+    def read_version():
+        (major, ) = read(">B")
+        if major == 255:
+            return read(">HHH")
+        return (major, *read(">BB"))
+
+    try:
+        with open(path, 'rb') as f:
+            (count, size) = read(">qq")
+            packages = {}
+            for _ in range(size):
+                name = f"{read_string()}/{read_string()}"
+                newest = read_version()
+                (previous, ) = read(">q")
+                packages[name] = [
+                    newest, *(read_version() for _ in range(previous))
+                ]
+            return (count, packages)
+    except (OSError, ValueError):
+        return None
+
+
+def write_registry(path, count, packages):
+    """Write a registry.dat in the format described in `read_registry`."""
+    def version_bytes(version):
+        if version[0] < 255 and version[1] < 256 and version[2] < 256:
+            return struct.pack(">BBB", *version)
+        return struct.pack(">BHHH", 255, *version)
+
+    def name_key(name):
+        return tuple(part.encode() for part in name.split("/"))
+
+    chunks = [struct.pack(">qq", count, len(packages))]
+    for name in sorted(packages, key=name_key):
+        for part in name_key(name):
+            chunks.append(struct.pack(">B", len(part)) + part)
+        versions = sorted(set(packages[name]), reverse=True)
+        chunks.append(version_bytes(versions[0]))
+        chunks.append(struct.pack(">q", len(versions) - 1))
+        chunks.extend(map(version_bytes, versions[1:]))
+
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}")
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(chunks))
+    os.replace(tmp_path, path)
+    trace.touched(path.stat().st_size)
+
+
+def update_registry(packages_root):
+    """Make registry.dat list every package version in packages_root.
+
+    The versions are added to the registry already there (if any) so that
+    elm can go on updating it from the package server when it is online.
+
+    """
+    path = packages_root / "registry.dat"
+    registry = read_registry(path)
+    (count, packages) = registry or (0, {})
+    added = 0
+    for (name, version) in scan_packages(packages_root):
+        versions = packages.setdefault(name, [])
+        if parse_version(version) not in versions:
+            versions.append(parse_version(version))
+            added += 1
+
+    # Elm asks the package server for the versions published after the
+    # count'th, so only a made up registry counts the versions we added.
+    if registry is None:
+        write_registry(path, added, packages)
+    elif added > 0:
+        write_registry(path, count, packages)
+
+
+def package_mirror():
+    mirror = os.getenv('ANOTHER_ELM_PACKAGE_MIRROR')
+    return Path(mirror) if mirror else None
+
+
+def seed_packages(packages_root, dependencies):
+    """Add package versions to packages_root without downloading them.
+
+    Directories are created for the known versions of the customized and
+    stubbed packages and for the versions of them in `dependencies` (a list
+    of (name, version) pairs), these must then be customized or stubbed.
+    Other dependencies are linked in from the package mirror given by
+    ANOTHER_ELM_PACKAGE_MIRROR (a directory laid out like a packages root).
+
+    Returns False, without seeding anything, unless every dependency can be
+    seeded.
+
+    """
+    mirror = package_mirror()
+
+    def mirrored(name, version):
+        if mirror is None or name in known_versions:
+            return None
+        package_root = mirror / name / version
+        return package_root if (package_root / "elm.json").is_file() else None
+
+    missing = [(name, version) for (name, version) in dependencies
+               if name not in known_versions and not (packages_root / name /
+                                                      version).is_dir()]
+    if not all(mirrored(name, version) for (name, version) in missing):
+        return False
+
+    std_versions = [(name, version)
+                    for (name, versions) in known_versions.items()
+                    for version in versions]
+    for (name, version) in [*std_versions, *dependencies]:
+        package_root = packages_root / name / version
+        if package_root.is_dir():
+            continue
+
+        if name in known_versions:
+            package_root.mkdir(parents=True)
+            continue
+
+        package_root.parent.mkdir(parents=True, exist_ok=True)
+        tmp_root = package_root.with_name(f"{version}.{os.getpid()}")
+        # Elm rewrites artifacts.dat in place, which must not reach the
+        # mirror through a hardlink.
+        shutil.copytree(mirrored(name, version),
+                        tmp_root,
+                        copy_function=link_or_copy,
+                        ignore=shutil.ignore_patterns("artifacts.dat"))
+        tmp_root.rename(package_root)
+
+    return True
+
+
+def read_custom_manifest():
+    """Read the manifest init.py wrote for the customized packages."""
+    try:
+        with open(customised_dir / "manifest.json") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def read_custom_hashes():
+    """Read the content hashes init.py recorded for the customized packages."""
+    return read_custom_manifest().get("packages", {})
+
+
+def link_or_copy(src, dest):
+    """Make dest a copy of src, sharing storage with src where possible.
+
+    The customised packages are hardlinks into init.py's object store so
+    hardlinking them again means every package version shares the same
+    files. Falls back to a reflink and then a plain copy (for example when
+    ELM_HOME is on another filesystem).
+
+    """
+    trace.touched(os.path.getsize(src))
+
+    try:
+        os.link(src, dest)
+        return
+    except OSError:
+        pass
+
+    try:
+        with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        return
+    except OSError:
+        pass
+
+    shutil.copyfile(src, dest)
+
+
+def link_tree(src, dest):
+    dest.mkdir()
+    for entry in os.scandir(src):
+        if entry.is_dir():
+            link_tree(src / entry.name, dest / entry.name)
+        else:
+            link_or_copy(entry.path, dest / entry.name)
+
+
+def customize(packages_root, manifest, custom_hashes, author, package):
+    name = f"{author}/{package}"
+    custom_package_dir = customised_dir / author / package
+
+    custom_src_dir = custom_package_dir / "src"
+    custom_json_file = custom_package_dir / "elm.json"
+    custom_hash = custom_hashes.get(name, {}).get("hash")
+
+    return customize_help(
+        manifest,
+        name,
+        scan_versions(packages_root, manifest, author, package),
+        custom_src_dir,
+        custom_json_file,
+        custom_hash,
+    )
+
+
+def is_customized(entry, custom_hash):
+    return (custom_hash is not None and entry.get("hash") == custom_hash
+            and entry.get("suffix") == random_suffix)
+
+
+def customize_help(manifest, name, versions, custom_src_dir, custom_json_file,
+                   custom_hash):
+    any_modified = False
+    for version_entry in versions:
+        (state, entry) = package_state(manifest, name, version_entry)
+
+        if state != CUSTOM or not is_customized(entry, custom_hash):
+            any_modified = True
+            package_root = Path(version_entry.path)
+
+            shutil.rmtree(package_root)
+            package_root.mkdir()
+
+            link_tree(custom_src_dir, package_root / "src")
+            link_or_copy(custom_json_file, package_root / "elm.json")
+
+            record_package(
+                manifest,
+                name,
+                version_entry.name,
+                package_root,
+                CUSTOM,
+                custom_hash,
+            )
+
+    return any_modified
+
+
+def parse_size(size):
+    """Parse a size in bytes with an optional K, M or G suffix."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    size = size.strip().upper()
+    if size[-1:] in units:
+        return int(size[:-1]) * units[size[-1]]
+    return int(size)
+
+
+class ArtifactCache:
+    """A cache of the artifacts.dat files elm compiles for each package.
+
+    Artifacts are keyed by the elm version, the random suffix, the hashes of
+    the customised packages and the package name and version (the contents of
+    stubs and of third party packages are determined by these). Entries are
+    evicted least recently used first to keep the cache within its budget.
+
+    Elm checks the dependency fingerprints stored in artifacts.dat itself so a
+    restored file is at worst rebuilt.
+
+    """
+    def __init__(self, cache_dir, budget, elm_version, custom_hashes):
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.key_prefix = hash_bytes(
+            elm_version.encode(),
+            random_suffix.encode(),
+            json.dumps(custom_hashes, sort_keys=True).encode(),
+        )
+
+    @classmethod
+    def from_env(cls, elm_version, custom_hashes):
+        cache_dir = os.getenv('ANOTHER_ELM_CACHE_DIR')
+        if not cache_dir:
+            return None
+
+        budget = parse_size(os.getenv('ANOTHER_ELM_CACHE_SIZE', '1G'))
+        return cls(Path(cache_dir), budget, elm_version, custom_hashes)
+
+    def entry(self, name, version):
+        key = hash_bytes(self.key_prefix.encode(),
+                         f"{name}/{version}".encode())
+        return self.cache_dir / key[:2] / key[2:]
+
+    def restore(self, packages_root, dependencies):
+        """Restore missing artifacts of the given packages from the cache."""
+        restored = 0
+        for (name, version) in dependencies.items():
+            package_root = packages_root / name / version
+            artifacts = package_root / "artifacts.dat"
+            if not package_root.is_dir() or artifacts.exists():
+                continue
+
+            entry = self.entry(name, version)
+            tmp_path = artifacts.with_name(f"artifacts.dat.{os.getpid()}")
+            try:
+                shutil.copyfile(entry, tmp_path)
+            except FileNotFoundError:
+                continue
+            os.replace(tmp_path, artifacts)
+            trace.touched(artifacts.stat().st_size)
+            os.utime(entry)
+            restored += 1
+
+        return restored
+
+    def store(self, packages_root, dependencies):
+        """Add the artifacts of the given packages that are not yet cached."""
+        stored = 0
+        for (name, version) in dependencies.items():
+            artifacts = packages_root / name / version / "artifacts.dat"
+            entry = self.entry(name, version)
+            if entry.exists() or not artifacts.exists():
+                continue
+
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = entry.with_name(f"{entry.name}.{os.getpid()}")
+            shutil.copyfile(artifacts, tmp_path)
+            os.replace(tmp_path, entry)
+            trace.touched(entry.stat().st_size)
+            stored += 1
+
+        if stored > 0:
+            self.evict()
+        return stored
+
+    def evict(self):
+        entries = []
+        for subdir in os.scandir(self.cache_dir):
+            if subdir.is_dir():
+                for entry in os.scandir(subdir.path):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.budget:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            total -= size
+
+
+def lock_or_wait(file, message):
+    """Lock file exclusively, printing message first if we have to wait."""
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"another-elm: {message}", file=sys.stderr)
+        fcntl.flock(file, fcntl.LOCK_EX)
+
+
+class StoreLock(contextlib.AbstractContextManager):
+    """Advisory locks on the package store used by one version of elm.
+
+    Compiles hold the store lock shared while they check that the packages
+    their project needs are ready and exclusively while packages are
+    downloaded, stubbed or customized. The lock is released before the
+    compiler runs: preparing the packages of another project only adds
+    package versions, so compiles and package preparations run side by side.
+
+    `elm make` runs hold the readers lock shared instead. It is taken
+    exclusively by the few steps that delete package versions a compile may
+    be reading and by `collect_garbage`. Long running commands (such as elm
+    reactor and elm repl) hold neither lock while elm runs. Closing the lock
+    files releases the locks.
+
+    """
+    def __init__(self, path):
+        path.parent.mkdir(exist_ok=True, parents=True)
+        self.file = open(path, 'a')
+        self.readers = open(path.with_name(readers_lock_file), 'a')
+
+    def shared(self):
+        fcntl.flock(self.file, fcntl.LOCK_SH)
+
+    def exclusive(self):
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def release(self):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def read_packages(self):
+        fcntl.flock(self.readers, fcntl.LOCK_SH)
+
+    def remove_packages(self):
+        lock_or_wait(self.readers,
+                     "waiting for running compiles to finish with packages")
+
+    def __exit__(self, _0, _1, _2):
+        self.readers.close()
+        self.file.close()
+
+
+class ElmStuff(contextlib.AbstractContextManager):
+    """Move the elm-stuff/{version}/ into a temperory directory and move
+    elm-stuff/another/{version} to elm-stuff/{version}
+
+    When the context manager exits it will move elm-stuff/{version}/ back to
+    its original location (in the another sub directory) and restore the
+    original contents of elm-stuff/{version}/.
+
+    Elm does not allow configuration of the elm-stuff directories location, so
+    we resort to this hack to get a separate directory for another-elm compiler
+    runs.
+
+    Concurrent runs in the same project share the swap: the first run swaps
+    the directories and the last one to exit swaps them back (elm itself
+    serializes builds in a project). Each run holds elm-stuff/another/users
+    shared while it uses the directories. elm-stuff/another/lock is held
+    exclusively only while swapping or clearing the directories, which also
+    needs the users lock exclusively (so clearing waits for the other runs).
+
+    """
+    def __init__(self, version, pkg_marker):
+        self.elm_stuff = Path('elm-stuff')
+        self.workdir = self.elm_stuff / version
+        self.marker = self.workdir / ".marker"
+        another_stuff = self.elm_stuff / 'another'
+        self.another_workdir = another_stuff / version
+        self.tempdir = another_stuff / "tmp"
+        # Exists while the directories are swapped.
+        self.swapped = another_stuff / "swapped"
+
+        another_stuff.mkdir(exist_ok=True, parents=True)
+
+        self.lock = open(another_stuff / "lock", 'a')
+        self.users = open(another_stuff / "users", 'a')
+        with self.swap_lock():
+            try:
+                fcntl.flock(self.users, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if self.swapped.exists() and not self.is_stale(pkg_marker):
+                    fcntl.flock(self.users, fcntl.LOCK_SH)
+                    return
+                self.wait_for_users()
+
+            with trace.phase("swap elm-stuff"):
+                if not self.swapped.exists():
+                    self.__swap()
+                if self.is_stale(pkg_marker):
+                    self.__remove_workdir()
+            fcntl.flock(self.users, fcntl.LOCK_SH)
+
+    @contextlib.contextmanager
+    def swap_lock(self):
+        with trace.phase("wait for elm-stuff lock"):
+            fcntl.flock(self.lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock, fcntl.LOCK_UN)
+
+    def wait_for_users(self):
+        """Wait (holding the swap lock) until we are the only run."""
+        fcntl.flock(self.users, fcntl.LOCK_UN)
+        with trace.phase("wait for elm-stuff lock"):
+            lock_or_wait(
+                self.users, "waiting for another compile (or watch build) "
+                "in this project to finish")
+
+    def __swap(self):
+        if self.tempdir.exists():
+            self.__recover()
+
+        with contextlib.suppress(FileNotFoundError):
+            self.workdir.rename(self.tempdir)
+
+        with contextlib.suppress(FileNotFoundError):
+            self.another_workdir.rename(self.workdir)
+
+        self.swapped.touch()
+
+    def __recover(self):
+        """Undo the swap of a run that was killed before it could exit."""
+        if self.workdir.exists():
+            if self.another_workdir.exists():
+                self.__remove_workdir()
+            else:
+                self.workdir.rename(self.another_workdir)
+        self.tempdir.rename(self.workdir)
+
+    def __restore(self):
+        self.swapped.unlink()
+        with contextlib.suppress(FileNotFoundError):
+            self.workdir.rename(self.another_workdir)
+        with contextlib.suppress(FileNotFoundError):
+            self.tempdir.rename(self.workdir)
+
+    def is_stale(self, pkg_marker):
+        try:
+            return self.marker.stat().st_mtime < pkg_marker.stat().st_mtime
+        except FileNotFoundError:
+            return True
+
+    def __exit__(self, _0, _1, _2):
+        fcntl.flock(self.users, fcntl.LOCK_UN)
+        with self.swap_lock():
+            try:
+                fcntl.flock(self.users, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another run is still using the directories.
+                pass
+            else:
+                with trace.phase("restore elm-stuff"):
+                    self.__restore()
+        self.users.close()
+        self.lock.close()
+
+    def mark(self):
+        try:
+            self.marker.touch(exist_ok=True)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        if not self.workdir.exists():
+            return
+        with self.swap_lock():
+            self.wait_for_users()
+            self.__remove_workdir()
+            fcntl.flock(self.users, fcntl.LOCK_SH)
+
+    def __remove_workdir(self):
+        with contextlib.suppress(FileNotFoundError):
+            shutil.rmtree(self.workdir)
+
+
+def probe_elm_version(elm):
+    return subprocess.run([elm, "--version"],
+                          stderr=subprocess.PIPE,
+                          stdout=subprocess.PIPE,
+                          check=True).stdout.decode("utf-8").strip()
+
+
+def another_elm_home():
+    """The directory holding another-elm's ELM_HOME for each elm version."""
+    elm_home_dir = os.getenv('ELM_HOME', default=Path.home() / '.elm')
+    return Path(elm_home_dir) / 'another'
+
+
+class Compiler:
+    """The elm compiler, run with another-elm's customised std packages.
+
+    `elm_version`, `custom_hashes` and the `manifest` of the packages root
+    can be passed in by callers (such as the daemon) that already know them.
+
+    """
+    def __init__(self,
+                 elm,
+                 *,
+                 elm_version=None,
+                 custom_hashes=None,
+                 manifest=None):
+        self.elm = elm
+        self.another_elm_home_dir = another_elm_home()
+
+        self.custom_env = os.environ.copy()
+        self.custom_env["ELM_HOME"] = self.another_elm_home_dir
+
+        if elm_version is None:
+            with trace.phase("elm --version"):
+                elm_version = probe_elm_version(elm)
+        self.elm_version = elm_version
+
+        self.packages_root = (self.another_elm_home_dir / elm_version /
+                              'packages')
+        self.packages_marker = self.packages_root / ".marker"
+        self.store_lock_path = (self.another_elm_home_dir / elm_version /
+                                "another-elm.lock")
+
+        if custom_hashes is None:
+            with trace.phase("read customised packages"):
+                custom_hashes = read_custom_hashes()
+        self.custom_hashes = custom_hashes
+        self.manifest = manifest
+
+        self.artifact_cache = ArtifactCache.from_env(elm_version,
+                                                     custom_hashes)
+        self.dependencies = None
+
+    def run(self, args, phase, **kwargs):
+        if self.dependencies is not None:
+            with trace.phase("restore artifacts"):
+                self.artifact_cache.restore(self.packages_root,
+                                            self.dependencies)
+        with trace.phase(phase):
+            return subprocess.run([self.elm] + args,
+                                  env=self.custom_env,
+                                  **kwargs).returncode
+
+    def prepare_packages(self, args, elm_stuff, store_lock):
+        """Stub and customize the std packages in the packages root.
+
+        Everything the project's elm.json pins is seeded without downloading
+        if possible (see `seed_packages`), otherwise elm downloads it in a
+        priming compile. With `args` None (for -Z --seed-packages) there is
+        no project: the packages in the mirror are seeded and elm is never
+        run. `store_lock` must be held exclusively.
+
+        """
+        packages_root = self.packages_root
+
+        manifest = read_manifest(packages_root)
+        if manifest.get("complete") and packages_root.is_dir():
+            manifest["complete"] = False
+            write_manifest(packages_root, manifest)
+
+        if args is None:
+            mirror = package_mirror()
+            dependencies = scan_packages(mirror) if mirror else []
+        else:
+            pinned = read_elm_json_dependencies(Path("elm.json"))
+            dependencies = [] if pinned is None else list(pinned.items())
+        with trace.phase("seed packages"):
+            seeded = seed_packages(packages_root, dependencies)
+        # Packages only give version ranges, elm has to pick the versions.
+        seeded = seeded and (args is None or pinned is not None)
+
+        if not seeded:
+            self.run(args,
+                     "priming compile",
+                     stderr=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL)
+
+        self.another_elm_home_dir.mkdir(exist_ok=True, parents=True)
+
+        with trace.phase("stub packages"):
+            for stub_package in stub_packages:
+                replace_with_stub(packages_root, manifest, 'elm', stub_package)
+
+        any_customized = False
+        for (author, pkg) in custom_packages:
+            with trace.phase("customize packages"):
+                customized = customize(packages_root, manifest,
+                                       self.custom_hashes, author, pkg)
+            if customized:
+                if elm_stuff is not None:
+                    elm_stuff.clear()
+                if not seeded:
+                    with trace.phase("wait for package readers"):
+                        store_lock.remove_packages()
+                    (packages_root / "registry.dat").unlink(missing_ok=True)
+
+                    self.run(args,
+                             "registry refetch compile",
+                             stderr=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL)
+                for author in os.scandir(packages_root):
+                    if (author.name != "elm"
+                            and author.name != "elm-explorations"
+                            and author.is_dir()):
+                        if seeded:
+                            # Built against the pristine packages.
+                            for artifacts in Path(
+                                    author.path).glob("*/*/artifacts.dat"):
+                                artifacts.unlink()
+                        else:
+                            shutil.rmtree(author.path)
+                any_customized = True
+
+        if seeded:
+            with trace.phase("write registry"):
+                update_registry(packages_root)
+
+        if any_customized:
+            self.packages_marker.touch(exist_ok=True)
+
+        if packages_root.is_dir():
+            manifest["complete"] = True
+            manifest["random-suffix"] = random_suffix
+            manifest["another-elm-version"] = another_elm_version
+            manifest["custom-packages"] = self.custom_hashes
+            write_manifest(packages_root, manifest)
+
+    def packages_ready(self, args, manifest=None):
+        return args[:1] == ["make"] and store_is_warm(
+            self.packages_root,
+            Path("elm.json"),
+            self.custom_hashes,
+            manifest,
+        )
+
+    def compile(self, args, elm_stuff):
+        """Run elm with args (in the elm-stuff swapped in by elm_stuff)."""
+        if self.artifact_cache is not None:
+            self.dependencies = read_elm_json_dependencies(Path("elm.json"))
+
+        # The manifest we were given may be out of date by the next compile.
+        (manifest, self.manifest) = (self.manifest, None)
+
+        with StoreLock(self.store_lock_path) as store_lock:
+            with trace.phase("wait for package store lock"):
+                store_lock.shared()
+            with trace.phase("check package store"):
+                ready = self.packages_ready(args, manifest)
+            if not ready:
+                with trace.phase("wait for package store lock"):
+                    store_lock.exclusive()
+                # Another run may have prepared the packages while we waited.
+                with trace.phase("check package store"):
+                    ready = self.packages_ready(args)
+                if not ready:
+                    self.prepare_packages(args, elm_stuff, store_lock)
+            if args[:1] == ["make"]:
+                store_lock.read_packages()
+            store_lock.release()
+
+            ret = self.run(args, "compile")
+            elm_stuff.mark()
+            if ret == 0:
+                self.mark_packages_used()
+            if ret == 0 and self.dependencies is not None:
+                with trace.phase("store artifacts"):
+                    self.artifact_cache.store(self.packages_root,
+                                              self.dependencies)
+            return ret
+
+    def mark_packages_used(self):
+        """Touch the packages the project pins, see `collect_garbage`."""
+        dependencies = self.dependencies
+        if dependencies is None:
+            dependencies = read_elm_json_dependencies(Path("elm.json")) or {}
+        for (name, version) in dependencies.items():
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(self.packages_root / name / version)
+
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class BuildMemo:
+    """Remember the last successful `elm make` of each command line.
+
+    A build is fingerprinted by its command line, elm.json, the elm files in
+    the source directories (and the entry files), the elm binary and its
+    version, the random suffix, the another-elm version, the hashes of the
+    customised packages and the packages marker. When the fingerprint matches
+    the last successful build of the same command line and the output file
+    still holds what that build wrote (or can be restored from the copy kept
+    of it) there is nothing to do.
+
+    Only builds that write an --output file are memoized. The state is kept
+    in elm-stuff/another/memo/.
+
+    """
+    def __init__(self, elm, args, output, known_elm_version=None):
+        self.elm = elm
+        self.args = args
+        self.output = output
+        self.memo_dir = Path('elm-stuff') / 'another' / 'memo'
+        key = hash_bytes(*(arg.encode() for arg in args))
+        self.state_file = self.memo_dir / f"{key}.json"
+        self.elm_path = None
+        self.known_elm_version = known_elm_version
+        self.elm_version = None
+        self.inputs = None
+
+    @classmethod
+    def from_args(cls, elm, args, known_elm_version=None):
+        """Returns None for commands that are not memoized.
+
+        `known_elm_version` can be given by callers (such as make-many and
+        the daemon) that already probed the elm version.
+
+        """
+        if args[:1] != ["make"] or os.getenv('ANOTHER_ELM_NO_MEMO'):
+            return None
+
+        output = None
+        for (arg, next_arg) in zip(args, [*args[1:], None]):
+            (option, equals, value) = arg.partition("=")
+            if option in ("--report", "--docs"):
+                return None
+            if option == "--output":
+                output = value if equals else next_arg
+        if output is None:
+            return None
+        return cls(elm, args, Path(output), known_elm_version)
+
+    def probe_elm_version(self):
+        """Probe the version of each elm binary once (until it changes).
+
+        A known version is used (and remembered) without probing.
+
+        """
+        elm_path = shutil.which(self.elm)
+        if elm_path is None:
+            return None
+        self.elm_path = elm_path
+        key = [elm_path, os.stat(elm_path).st_mtime_ns]
+
+        version_file = self.memo_dir / "elm-version.json"
+        try:
+            with open(version_file) as f:
+                cached = json.load(f)
+            if cached["key"] == key:
+                return cached["version"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            pass
+
+        version = self.known_elm_version
+        if version is None:
+            version = probe_elm_version(elm_path)
+        self.write_json(version_file, {"key": key, "version": version})
+        return version
+
+    def hash_inputs(self):
+        elm_json_path = Path("elm.json")
+        digest = hashlib.sha256()
+        for part in (another_elm_version, random_suffix, self.elm_path,
+                     self.elm_version, *self.args):
+            digest.update(part.encode() + b'\0')
+        # init.py can update the customised packages without changing the
+        # suffix (the packages marker only changes once a compile notices).
+        digest.update(
+            json.dumps(read_custom_hashes(), sort_keys=True).encode())
+        with open(elm_json_path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+
+        sources = {Path(arg) for arg in self.args if arg.endswith(".elm")}
+        for directory in read_source_directories(elm_json_path):
+            sources.update(directory.rglob("*.elm"))
+        for source in sorted(sources):
+            digest.update(str(source).encode() + b'\0')
+            digest.update(bytes.fromhex(hash_file(source)))
+
+        return digest.hexdigest()
+
+    def fingerprint(self):
+        marker = another_elm_home() / self.elm_version / 'packages' / ".marker"
+        try:
+            marker_mtime = marker.stat().st_mtime_ns
+        except FileNotFoundError:
+            marker_mtime = None
+        return hash_bytes(self.inputs.encode(),
+                          f"{marker}:{marker_mtime}".encode())
+
+    def up_to_date(self):
+        """Is the output of the last build of these args still good?
+
+        If the output file changed since that build it is restored from the
+        copy kept of it.
+
+        """
+        try:
+            self.elm_version = self.probe_elm_version()
+            if self.elm_version is None:
+                return False
+            self.inputs = self.hash_inputs()
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            return False
+
+        if state.get("fingerprint") != self.fingerprint():
+            return False
+
+        with contextlib.suppress(OSError):
+            if hash_file(self.output) == state.get("output"):
+                return True
+
+        try:
+            shutil.copyfile(self.memo_dir / "outputs" / state["output"],
+                            self.output)
+        except (OSError, KeyError):
+            return False
+        trace.touched(self.output.stat().st_size)
+        return True
+
+    def save(self):
+        """Record a successful build (of the inputs hashed by up_to_date)."""
+        if self.inputs is None:
+            return
+
+        try:
+            output_hash = hash_file(self.output)
+            copy = self.memo_dir / "outputs" / output_hash
+            if not copy.exists():
+                copy.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = copy.with_name(f"{copy.name}.{os.getpid()}")
+                shutil.copyfile(self.output, tmp_path)
+                os.replace(tmp_path, copy)
+                trace.touched(copy.stat().st_size)
+        except OSError:
+            return
+
+        self.write_json(self.state_file, {
+            "fingerprint": self.fingerprint(),
+            "output": output_hash,
+        })
+        self.evict()
+
+    def evict(self):
+        """Remove the copies of outputs no command line refers to."""
+        used = set()
+        for state_file in self.memo_dir.glob("*.json"):
+            with contextlib.suppress(OSError, ValueError, AttributeError):
+                with open(state_file) as f:
+                    used.add(json.load(f).get("output"))
+
+        for copy in (self.memo_dir / "outputs").iterdir():
+            if copy.name not in used:
+                with contextlib.suppress(FileNotFoundError):
+                    copy.unlink()
+
+    def write_json(self, path, value):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+
+def try_lock(path):
+    """Lock path exclusively unless another process holds a lock on it.
+
+    Returns the open lock file (closing it releases the lock) or None.
+
+    """
+    try:
+        lock = open(path, 'a')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def last_used(path):
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def freed_size(path):
+    """The number of bytes deleting the directory at path would free.
+
+    Files that are also linked from elsewhere (the customised package store
+    or another package version) are not counted, nor is the stamp file.
+
+    """
+    size = 0
+    for (dirpath, _, filenames) in os.walk(path):
+        for filename in filenames:
+            if filename == stamp_file:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                stat = os.lstat(os.path.join(dirpath, filename))
+                if stat.st_nlink == 1:
+                    size += stat.st_size
+    return size
+
+
+def format_size(size):
+    for unit in ("", "K", "M"):
+        if size < 1 << 10:
+            return f"{size:.0f}{unit}"
+        size /= 1 << 10
+    return f"{size:.1f}G"
+
+
+def remove_tree(path, root):
+    """Delete path and then any of its parents below root left empty."""
+    shutil.rmtree(path, ignore_errors=True)
+    for parent in path.parents:
+        if parent == root:
+            break
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+
+
+def forget_packages(packages_root, removed):
+    """Forget the package versions (name, version) deleted from packages_root.
+
+    Their manifest entries are dropped and the manifest is no longer complete
+    so that the next compile prepares the packages it needs again. The
+    registry.dat (which may have been written by `update_registry` and list
+    them) is deleted, to be written again or fetched by elm.
+
+    """
+    manifest = read_manifest(packages_root)
+    for (name, version) in removed:
+        manifest["packages"].pop(f"{name}/{version}", None)
+    manifest["complete"] = False
+    write_manifest(packages_root, manifest)
+    (packages_root / "registry.dat").unlink(missing_ok=True)
+
+
+def collect_garbage(budget, projects, *, dry_run=False, log=print):
+    """Delete the least recently used package versions and elm-stuff.
+
+    The candidates are the package versions in another-elm's ELM_HOME (of
+    every elm version), last used when a compile that pins them last
+    succeeded, and the elm-stuff/another/<elm version> directories of the
+    given projects, last used when they were last compiled in. They are
+    deleted oldest first until the bytes deleting the rest would free (see
+    `freed_size`) fit within `budget`. Candidates that would free nothing
+    are kept, as are package stores and projects a running compile has
+    locked.
+
+    Deleted package versions are forgotten by their package store (see
+    `forget_packages`). Objects of the customised package store that no
+    package links to any more are deleted whatever the budget. Returns the
+    number of bytes freed.
+
+    """
+    verb = "would remove" if dry_run else "removing"
+    entries = []
+    packages_roots = set()
+    with contextlib.ExitStack() as locks:
+        home = another_elm_home()
+        version_dirs = [Path(e.path) for e in os.scandir(home)
+                        if e.is_dir()] if home.is_dir() else []
+        for version_dir in version_dirs:
+            lock = try_lock(version_dir / "another-elm.lock")
+            readers = lock and try_lock(version_dir / readers_lock_file)
+            if readers is None:
+                if lock is not None:
+                    lock.close()
+                log(f"skipping {version_dir}: in use")
+                continue
+            locks.enter_context(lock)
+            locks.enter_context(readers)
+            packages_root = version_dir / "packages"
+            packages_roots.add(packages_root)
+            for (name, version) in scan_packages(packages_root):
+                path = packages_root / name / version
+                entries.append(
+                    (last_used(path), freed_size(path), path, packages_root))
+
+        for project in projects:
+            another_stuff = Path(project) / "elm-stuff" / "another"
+            if not another_stuff.is_dir():
+                continue
+            lock = try_lock(another_stuff / "users")
+            if lock is None:
+                log(f"skipping {another_stuff}: in use")
+                continue
+            locks.enter_context(lock)
+            for entry in os.scandir(another_stuff):
+                path = Path(entry.path)
+                if entry.is_dir() and entry.name not in ("tmp", "memo"):
+                    entries.append((last_used(path / ".marker"),
+                                    freed_size(path), path, another_stuff))
+
+        # Deleting a package version whose files are all shared (with the
+        # customised package store, for example) frees nothing, it would
+        # only have to be customized again.
+        entries = [entry for entry in entries if entry[1] > 0]
+        total = sum(size for (_, size, _, _) in entries)
+        freed = 0
+        removed = {}
+        for (used, size, path, root) in sorted(entries):
+            if total <= budget:
+                break
+            when = time.strftime("%Y-%m-%d", time.localtime(used))
+            log(f"{verb} {path} ({format_size(size)}, last used {when})")
+            if not dry_run:
+                remove_tree(path, root)
+                if root in packages_roots:
+                    removed.setdefault(root, []).append(
+                        (path.parent.relative_to(root).as_posix(), path.name))
+            total -= size
+            freed += size
+
+        # While we still hold the store locks.
+        for (packages_root, versions) in removed.items():
+            forget_packages(packages_root, versions)
+
+        # Objects only linked from the package versions deleted above have
+        # just become garbage too. Recent objects may be about to be linked
+        # by a running init.py.
+        garbage = 0
+        for path in objects_dir.glob("*/*"):
+            with contextlib.suppress(FileNotFoundError):
+                stat = path.lstat()
+                if (stat.st_nlink == 1 and "." not in path.name
+                        and stat.st_mtime < time.time() - 3600):
+                    if not dry_run:
+                        path.unlink()
+                    garbage += stat.st_size
+        if garbage > 0:
+            log(f"{verb} {format_size(garbage)} of unused objects")
+            freed += garbage
+
+    return freed
+
+
+def auto_collect_garbage():
+    """Collect garbage once a day if ANOTHER_ELM_GC_BUDGET is set."""
+    budget = os.getenv('ANOTHER_ELM_GC_BUDGET')
+    if not budget:
+        return
+    stamp = another_elm_home() / "gc-stamp"
+    if last_used(stamp) > time.time() - 24 * 60 * 60:
+        return
+    stamp.touch()
+    with trace.phase("collect garbage"):
+        collect_garbage(parse_size(budget), ["."], log=lambda _: None)
+
+
+def run_elm(elm, args, **kwargs):
+    """Run the elm compiler with the customised std packages.
+
+    Keyword arguments are passed on to `Compiler`.
+
+    """
+    if "--stdlib-variant" in args:
+        print(f"another-elm {another_elm_version}")
+        return 0
+
+    for unstable_opt in ("--print-random-suffix", "--seed-packages"):
+        if unstable_opt not in args:
+            continue
+        arg_index = args.index(unstable_opt)
+        if arg_index == 0 or args[arg_index - 1] != "-Z":
+            print(
+                f"{unstable_opt} in an unstable option.",
+                file=sys.stderr,
+            )
+            print(
+                f"Please opt in to unstable features with -Z {unstable_opt}",
+                file=sys.stderr,
+            )
+            return 1
+
+        if unstable_opt == "--print-random-suffix":
+            print(random_suffix)
+            return 0
+
+        compiler = Compiler(elm, **kwargs)
+        with StoreLock(compiler.store_lock_path) as store_lock:
+            store_lock.exclusive()
+            compiler.prepare_packages(None, None, store_lock)
+        return 0
+
+    trace.start(os.getenv('ANOTHER_ELM_TRACE'))
+    try:
+        with trace.phase("another-elm"):
+            memo = BuildMemo.from_args(elm, args, kwargs.get("elm_version"))
+            if memo is not None:
+                with trace.phase("check build memo"):
+                    if memo.up_to_date():
+                        return 0
+                if memo.elm_version is not None:
+                    kwargs.setdefault("elm_version", memo.elm_version)
+
+            compiler = Compiler(elm, **kwargs)
+
+            with ElmStuff(compiler.elm_version,
+                          compiler.packages_marker) as elm_stuff:
+                ret = compiler.compile(args, elm_stuff)
+                if ret == 0 and memo is not None:
+                    with trace.phase("save build memo"):
+                        memo.save()
+            if ret == 0:
+                auto_collect_garbage()
+            return ret
+    finally:
+        trace.finish()
@@ -0,0 +1,35 @@
+import json
+import os
+
+# Holds the customised package store and config.json.
+data_dir = os.path.join(
+    os.environ.get(
+        "XDG_DATA_HOME",
+        os.path.join(os.path.expanduser("~"), ".local", "share"),
+    ), "another-elm")
+
+# Written by init.py, see `read_config`.
+config_file = os.path.join(data_dir, "config.json")
+
+
+def read_config():
+    """Read the configuration init.py installed.
+
+    It records the std checkout the another_elm package is imported from
+    ("std-dir"), the random suffix of the customised packages
+    ("random-suffix") and the another-elm version they were customised by
+    ("another-elm-version"). Returns an empty dict if another-elm has not
+    been installed.
+
+    """
+    try:
+        with open(config_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+config = read_config()
+std_dir = config.get("std-dir")
+random_suffix = config.get("random-suffix")
+another_elm_version = config.get("another-elm-version")
@@ -0,0 +1,187 @@
+import contextlib
+import json
+import os
+import selectors
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from .compiler import (another_elm_version, customised_dir, probe_elm_version,
+                       random_suffix, read_custom_hashes, read_manifest,
+                       run_elm)
+from .watch import Watcher
+
+
+def default_daemon_socket():
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR', tempfile.gettempdir())
+    return Path(runtime_dir) / f"another-elm-{os.getuid()}.sock"
+
+
+class DaemonState:
+    """What the daemon remembers between compiles.
+
+    The elm version is cached for each elm binary (until the binary changes)
+    and the customised package hashes and packages root manifests are cached
+    until the watcher sees their directories change.
+
+    """
+    def __init__(self):
+        self.watcher = Watcher()
+        self.elm_versions = {}
+        self.custom_hashes = None
+        self.manifests = {}
+
+    def refresh(self):
+        for root in self.watcher.changes():
+            if root == customised_dir:
+                self.custom_hashes = None
+            self.manifests.pop(root, None)
+
+    def elm_version(self, elm, env):
+        elm_path = shutil.which(elm, path=env.get("PATH"))
+        if elm_path is None:
+            return None
+        key = (elm_path, os.stat(elm_path).st_mtime_ns)
+        if key not in self.elm_versions:
+            self.elm_versions[key] = probe_elm_version(elm_path)
+        return self.elm_versions[key]
+
+    def run_elm_kwargs(self, elm, env):
+        """Work out the keyword arguments to pass to `run_elm`."""
+        self.refresh()
+        kwargs = {}
+        elm_version = self.elm_version(elm, env)
+        if elm_version is None:
+            return kwargs
+        kwargs["elm_version"] = elm_version
+
+        # Watch before reading so that we cannot miss a change.
+        if self.custom_hashes is None and self.watcher.watch(customised_dir):
+            self.custom_hashes = read_custom_hashes()
+        if self.custom_hashes is not None:
+            kwargs["custom_hashes"] = self.custom_hashes
+
+        elm_home_dir = env.get('ELM_HOME', Path.home() / '.elm')
+        packages_root = Path(
+            elm_home_dir) / 'another' / elm_version / 'packages'
+        if packages_root not in self.manifests and self.watcher.watch(
+                packages_root):
+            self.manifests[packages_root] = read_manifest(packages_root)
+        if packages_root in self.manifests:
+            kwargs["manifest"] = self.manifests[packages_root]
+
+        return kwargs
+
+
+def serve_daemon(socket_path):
+    """Compile on behalf of `run_daemon_client` until killed.
+
+    Each request is handled in a forked child (so that it can change
+    directory, environment and stdio) which inherits everything the daemon
+    has cached. The customised package store is always the one of the
+    daemon's XDG_DATA_HOME.
+
+    """
+    # A daemon that was killed leaves its socket behind, nothing listens.
+    with contextlib.suppress(FileNotFoundError, ConnectionRefusedError):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.connect(str(socket_path))
+            print(f"another-elm daemon: already running at {socket_path}",
+                  file=sys.stderr)
+            return 1
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(socket_path)
+
+    # Make sure that the socket is removed when we are asked to stop.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    state = DaemonState()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(socket_path))
+    listener.listen()
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    if state.watcher.fileno() is not None:
+        selector.register(state.watcher.fileno(), selectors.EVENT_READ)
+
+    print(f"another-elm daemon: listening at {socket_path}", file=sys.stderr)
+    try:
+        while True:
+            for (key, _) in selector.select(timeout=1):
+                if key.fileobj is listener:
+                    (conn, _) = listener.accept()
+                    with conn:
+                        if not serve_daemon_request(state, listener, conn):
+                            return 0
+                else:
+                    state.refresh()
+
+            # Reap finished compiles.
+            with contextlib.suppress(ChildProcessError):
+                while os.waitpid(-1, os.WNOHANG) != (0, 0):
+                    pass
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        listener.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+
+
+def serve_daemon_request(state, listener, conn):
+    """Fork a child to handle one request.
+
+    Returns False if the daemon should exit because the client is a
+    different another-elm install.
+
+    """
+    (data, fds, _, _) = socket.recv_fds(conn, 64 * 1024, 3)
+    chunks = [data]
+    while data:
+        data = conn.recv(64 * 1024)
+        chunks.append(data)
+    request = json.loads(b''.join(chunks))
+
+    try:
+        if (request["random-suffix"] != random_suffix
+                or request["another-elm-version"] != another_elm_version):
+            conn.sendall(json.dumps({"error": "stale daemon"}).encode())
+            return False
+
+        env = request["env"]
+        elm = env.get('ELM', 'elm')
+        try:
+            kwargs = state.run_elm_kwargs(elm, env)
+        except (OSError, subprocess.CalledProcessError):
+            kwargs = {}
+
+        if os.fork() == 0:
+            # The child must never return to the daemon's loop.
+            try:
+                listener.close()
+                state.watcher.close()
+                for (target, fd) in enumerate(fds):
+                    os.dup2(fd, target)
+                try:
+                    os.chdir(request["cwd"])
+                    os.environ.clear()
+                    os.environ.update(env)
+                    code = run_elm(elm, request["args"], **kwargs)
+                except BaseException as e:
+                    print(f"another-elm daemon: {e!r}", file=sys.stderr)
+                    code = 1
+                sys.stdout.flush()
+                sys.stderr.flush()
+                conn.sendall(json.dumps({"exit": code}).encode())
+            finally:
+                os._exit(0)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+    return True
@@ -0,0 +1,293 @@
+import argparse
+import contextlib
+import os
+import selectors
+import signal
+import struct
+import sys
+import time
+from pathlib import Path
+
+from .compiler import (Compiler, ElmStuff, customised_dir, random_suffix,
+                       read_custom_manifest, read_source_directories, trace)
+
+
+class Watcher:
+    """Report changes to files in watched directories.
+
+    Uses inotify on linux and falls back to comparing modification times when
+    inotify is not available. Directories are watched non-recursively unless
+    `recursive` is set (in which case new subdirectories are watched as they
+    appear). Subdirectories named in `skip` are never watched.
+
+    """
+
+    # From sys/inotify.h
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+            | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+            | IN_MOVE_SELF)
+
+    def __init__(self, recursive=False, skip=()):
+        self.recursive = recursive
+        self.skip = set(skip)
+        # Maps watch descriptors to (root, directory).
+        self.watches = {}
+        self.snapshots = {}
+        self.fd = None
+        try:
+            import ctypes
+
+            self.libc = ctypes.CDLL(None, use_errno=True)
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+        except (OSError, AttributeError):
+            pass
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def watch(self, root):
+        """Watch the directory root, returns False if it does not exist."""
+        root = Path(root)
+        if not root.is_dir():
+            return False
+
+        if self.fd is None:
+            self.snapshots.setdefault(root, self.__snapshot(root))
+        else:
+            for directory in self.__directories(root):
+                self.__add_watch(root, directory)
+        return True
+
+    def __directories(self, directory):
+        yield directory
+        if self.recursive:
+            for (dirpath, dirnames, _) in os.walk(directory):
+                dirnames[:] = [d for d in dirnames if d not in self.skip]
+                for d in dirnames:
+                    yield Path(dirpath) / d
+
+    def __add_watch(self, root, directory):
+        wd = self.libc.inotify_add_watch(self.fd, bytes(directory), self.MASK)
+        if wd >= 0:
+            self.watches[wd] = (root, directory)
+
+    def __snapshot(self, root):
+        snapshot = {}
+        for directory in self.__directories(root):
+            for entry in os.scandir(directory):
+                if entry.name in self.skip:
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    snapshot[entry.path] = entry.stat().st_mtime_ns
+        return snapshot
+
+    def changes(self):
+        """Return the paths that changed since the last call.
+
+        The result maps each watched root with changes to a set of the changed
+        paths within it (the root itself is included when it was removed or
+        when we might have missed changes). Never blocks.
+
+        """
+        changed = {}
+        if self.fd is None:
+            for (root, snapshot) in list(self.snapshots.items()):
+                try:
+                    new_snapshot = self.__snapshot(root)
+                except FileNotFoundError:
+                    del self.snapshots[root]
+                    changed[root] = {root}
+                    continue
+                paths = {
+                    Path(path)
+                    for path in snapshot.keys() | new_snapshot.keys()
+                    if snapshot.get(path) != new_snapshot.get(path)
+                }
+                if paths:
+                    self.snapshots[root] = new_snapshot
+                    changed[root] = paths
+            return changed
+
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                (wd, mask, _,
+                 length) = struct.unpack_from("iIII", data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                offset += 16 + length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    for (root, _) in self.watches.values():
+                        changed.setdefault(root, set()).add(root)
+                    continue
+
+                watched = self.watches.get(wd)
+                if watched is None:
+                    continue
+                (root, directory) = watched
+                path = directory / os.fsdecode(name) if name else directory
+                if path.name in self.skip:
+                    continue
+                changed.setdefault(root, set()).add(path)
+
+                if mask & self.IN_IGNORED:
+                    del self.watches[wd]
+                    changed[root].add(root)
+                elif (self.recursive and mask & self.IN_ISDIR
+                      and mask & (self.IN_CREATE | self.IN_MOVED_TO)
+                      and path.name not in self.skip):
+                    for subdir in self.__directories(path):
+                        self.__add_watch(root, subdir)
+
+
+def wait_for_changes(watchers, timeout):
+    """Wait up to timeout seconds for any of watchers to see changes."""
+    fds = [watcher.fileno() for watcher in watchers]
+    if None in fds:
+        time.sleep(min(timeout, 0.25) if timeout is not None else 0.25)
+    else:
+        with selectors.DefaultSelector() as selector:
+            for fd in fds:
+                selector.register(fd, selectors.EVENT_READ)
+            selector.select(timeout)
+    return [watcher.changes() for watcher in watchers]
+
+
+def watch_sources(elm_json_path):
+    watcher = Watcher(recursive=True,
+                      skip={"elm-stuff", "node_modules", ".git"})
+    for source_dir in read_source_directories(elm_json_path):
+        watcher.watch(source_dir)
+    return watcher
+
+
+def sources_changed(changes):
+    return any(path == root or path.suffix == ".elm" or path.is_dir()
+               for (root, paths) in changes.items() for path in paths)
+
+
+def config_changed(changes):
+    return any(path.name == (
+        "manifest.json" if root == customised_dir else "elm.json")
+               for (root, paths) in changes.items() for path in paths)
+
+
+def watch(elm, args):
+    """Recompile the project whenever its elm source files change.
+
+    The whole session uses one `Compiler` (so the elm version is probed and
+    the customised package hashes read once). elm-stuff is only swapped in
+    by an `ElmStuff` while a build runs (other runs of another-elm in the
+    project share the swap and compile alongside the watch). Changes to
+    elm.json or to the customised packages invalidate these just as they
+    would between two runs of another-elm.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog="another-elm watch",
+        allow_abbrev=False,
+        description="Recompile whenever the project's elm files change. "
+        "Other arguments are passed on to `elm make`.")
+    parser.add_argument('--debounce',
+                        type=int,
+                        default=100,
+                        metavar="MS",
+                        help="Wait for MS milliseconds without changes "
+                        "before compiling (default: %(default)s)")
+    (options, make_args) = parser.parse_known_args(args)
+    make_args = ["make"] + make_args
+    debounce = options.debounce / 1000
+
+    elm_json_path = Path("elm.json")
+    if not elm_json_path.is_file():
+        print("another-elm watch: no elm.json in the current directory",
+              file=sys.stderr)
+        return 1
+
+    def build():
+        with ElmStuff(compiler.elm_version,
+                      compiler.packages_marker) as elm_stuff:
+            ret = compiler.compile(make_args, elm_stuff)
+        status = "ok" if ret == 0 else f"failed ({ret})"
+        print(f"another-elm watch: build {status}, waiting for changes",
+              file=sys.stderr)
+
+    # Make sure that elm-stuff is swapped back when we are asked to stop.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    config = Watcher()
+    config.watch(Path("."))
+    config.watch(customised_dir)
+    sources = watch_sources(elm_json_path)
+
+    trace.start(os.getenv('ANOTHER_ELM_TRACE'))
+    try:
+        with trace.phase("another-elm watch"):
+            compiler = Compiler(elm)
+            build()
+            while True:
+                (source_changes,
+                 config_changes) = wait_for_changes([sources, config], None)
+                rebuild = sources_changed(source_changes)
+                reconfigure = config_changed(config_changes)
+                if not (rebuild or reconfigure):
+                    continue
+
+                # Editors often write a file in several steps, wait for
+                # things to settle before compiling.
+                while True:
+                    (source_changes,
+                     config_changes) = wait_for_changes([sources, config],
+                                                        debounce)
+                    if not (source_changes or config_changes):
+                        break
+                    reconfigure |= config_changed(config_changes)
+
+                if reconfigure:
+                    custom_manifest = read_custom_manifest()
+                    if custom_manifest.get("random-suffix",
+                                           random_suffix) != random_suffix:
+                        print(
+                            "another-elm watch: another-elm has been "
+                            "reinstalled, please restart the watch",
+                            file=sys.stderr)
+                        return 1
+                    config.watch(customised_dir)
+                    compiler = Compiler(elm, elm_version=compiler.elm_version)
+                    sources.close()
+                    sources = watch_sources(elm_json_path)
+
+                print("another-elm watch: changes detected, compiling",
+                      file=sys.stderr)
+                build()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        sources.close()
+        config.close()
+        trace.finish()
@@ -14,12 +14,39 @@ const _Channel_rawUnbounded = () => {
     id: _Channel_channelId++,
   };
   _Channel_channels.set(id, {
+    // Messages waiting to be received are messages[head..], see
+    // _Channel_takeMessage.
     messages: [],
+    head: 0,
     wakers: new Set(),
   });
   return id;
 };
 
+// Take the oldest message from a channel's mailbox (or undefined if it is
+// empty). Moving the head index (rather than using `shift()`) keeps receiving a
+// burst of messages linear in the size of the burst.
+const _Channel_takeMessage = (channel) => {
+  if (channel.head === channel.messages.length) {
+    channel.messages.length = 0;
+    channel.head = 0;
+    return undefined;
+  }
+
+  const message = channel.messages[channel.head];
+  channel.messages[channel.head] = undefined;
+  channel.head += 1;
+
+  // Drop the taken slots once they make up most of the array while keeping
+  // receives amortised O(1).
+  if (channel.head >= 1024 && channel.head * 2 >= channel.messages.length) {
+    channel.messages.splice(0, channel.head);
+    channel.head = 0;
+  }
+
+  return message;
+};
+
 const _Channel_rawRecv = F2((channelId, onMessage) => {
   const channel = _Channel_channels.get(channelId);
   if (__Basics_isDebug && channel === undefined) {
@@ -30,7 +57,7 @@ const _Channel_rawRecv = F2((channelId, onMessage) => {
     );
   }
 
-  const message = channel.messages.shift();
+  const message = _Channel_takeMessage(channel);
   if (message !== undefined) {
     onMessage(message);
     return (x) => x;
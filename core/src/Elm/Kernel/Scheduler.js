@@ -36,7 +36,14 @@ let _Scheduler_guid = 0;
 const _Scheduler_tryAbortForProcesses = new WeakMap();
 const _Scheduler_doNotStep = new WeakSet();
 let _Scheduler_working = false;
+// The run queue holds [procId, rootTask] pairs from _Scheduler_queueHead to
+// its end. Taking the head by moving an index (rather than with `shift()`)
+// keeps draining a burst of enqueued processes linear in the size of the
+// burst.
 const _Scheduler_queue = [];
+let _Scheduler_queueHead = 0;
+// The ids of the processes in the queue (only kept in debug mode).
+const _Scheduler_queuedIds = new Set();
 
 function _Scheduler_getGuid() {
   return _Scheduler_guid++;
@@ -52,14 +59,39 @@ function _Scheduler_tryAbortProcess(id) {
   return __Utils_Tuple0;
 }
 
+const _Scheduler_dequeue = () => {
+  if (_Scheduler_queueHead === _Scheduler_queue.length) {
+    _Scheduler_queue.length = 0;
+    _Scheduler_queueHead = 0;
+    return undefined;
+  }
+
+  const next = _Scheduler_queue[_Scheduler_queueHead];
+  _Scheduler_queue[_Scheduler_queueHead] = undefined;
+  _Scheduler_queueHead += 1;
+
+  // Drop the taken slots once they make up most of the array (so a long
+  // burst does not hold on to memory) while keeping dequeues amortised O(1).
+  if (_Scheduler_queueHead >= 1024 && _Scheduler_queueHead * 2 >= _Scheduler_queue.length) {
+    _Scheduler_queue.splice(0, _Scheduler_queueHead);
+    _Scheduler_queueHead = 0;
+  }
+
+  return next;
+};
+
 const _Scheduler_rawEnqueue = (procId) => (rootTask) => {
   // todo(harry): abstract this into elm somehow.
-  if (__Basics_isDebug && _Scheduler_queue.some((p) => p[0].a.__$id === procId.a.__$id)) {
-    __Debug_crash(
-      12,
-      __Debug_runtimeCrashReason(`procIdAlreadyInQueue`),
-      procId && procId.a && procId.a.__$id
-    );
+  if (__Basics_isDebug) {
+    if (_Scheduler_queuedIds.has(procId.a.__$id)) {
+      __Debug_crash(
+        12,
+        __Debug_runtimeCrashReason(`procIdAlreadyInQueue`),
+        procId && procId.a && procId.a.__$id
+      );
+    }
+
+    _Scheduler_queuedIds.add(procId.a.__$id);
   }
 
   _Scheduler_queue.push([procId, rootTask]);
@@ -69,13 +101,17 @@ const _Scheduler_rawEnqueue = (procId) => (rootTask) => {
 
   _Scheduler_working = true;
   for (;;) {
-    const next = _Scheduler_queue.shift();
+    const next = _Scheduler_dequeue();
     if (next === undefined) {
       _Scheduler_working = false;
       return procId;
     }
 
     const [newProcId, newRootTask] = next;
+    if (__Basics_isDebug) {
+      _Scheduler_queuedIds.delete(newProcId.a.__$id);
+    }
+
     if (!_Scheduler_doNotStep.has(newProcId)) {
       _Scheduler_tryAbortForProcesses.set(
         newProcId,
@@ -1,15 +1,18 @@
 #! /usr/bin/env python3
 
 import argparse
-import fileinput
+import hashlib
+import json
 import os
 import random
+import re
 import shutil
 import subprocess
 import sys
-from fileinput import FileInput
 from pathlib import Path
 
+from another_elm.compiler import custom_packages, link_or_copy
+
 version = 0
 
 parser = argparse.ArgumentParser(description='Initialise/install another-elm')
@@ -19,60 +22,159 @@ parser.add_argument('--dir',
                     help="Directory to install another-elm into",
                     default=Path.home() / ".local" / "bin")
 
+parser.add_argument('--reset',
+                    action='store_true',
+                    help="Pick a new random suffix and rewrite all of the "
+                    "customised std packages")
+
+parser.add_argument('--deterministic-suffix',
+                    action='store_true',
+                    help="Derive the random suffix from the std sources, the "
+                    "another-elm version and the salt (rather than picking a "
+                    "random one) so that the customised packages are "
+                    "reproducible")
+parser.add_argument('--suffix-salt',
+                    help="Per-site secret mixed into a deterministic suffix "
+                    "(default: $ANOTHER_ELM_SUFFIX_SALT)",
+                    default=os.getenv('ANOTHER_ELM_SUFFIX_SALT', ''))
+parser.add_argument('--seed-packages',
+                    action='store_true',
+                    help="Fill in another-elm's ELM_HOME with the customised "
+                    "and stubbed packages (and the packages in "
+                    "$ANOTHER_ELM_PACKAGE_MIRROR) and a registry.dat listing "
+                    "them, so that compiles need no network access")
+
 args = parser.parse_args()
 
 elm_std_dir = Path(__file__).resolve().parent
 binary_path = args.dir / "another-elm"
-xdg_data_home = os.environ.get(
-    "XDG_DATA_HOME",
-    Path.home() / ".local" / "share",
-)
+xdg_data_home = Path(
+    os.environ.get(
+        "XDG_DATA_HOME",
+        Path.home() / ".local" / "share",
+    ))
 customised_dir = xdg_data_home / "another-elm" / "packages"
+objects_dir = xdg_data_home / "another-elm" / "objects"
+# Read by the another-elm launcher and another_elm/config.py.
+config_file = xdg_data_home / "another-elm" / "config.json"
 
+module_header_re = re.compile(
+    r"^module\s+[\w.]+\s+exposing\s*\(((?:[^()]|\([^()]*\))*)\)", re.MULTILINE)
 
-def copy_file_with_replacement(src, dest, random_suffix, another_elm_version):
-    def on_line(line):
-        return line.replace(
-            "Platform.Unstable.",
-            f"Platform.Unstable{random_suffix}.",
-        ).replace(
-            'ANOTHER-ELM-VERSION',
-            another_elm_version,
-        )
 
-    with dest.open(mode='w') as dest_file:
-        with FileInput(src, inplace=False) as src_reader:
-            for line in src_reader:
-                print(on_line(line), end='', file=dest_file)
+def store_object(contents):
+    """Add contents to the content addressed object store.
+
+    Objects are read only as they are hardlinked into many packages.
+
+    """
+    digest = hashlib.sha256(contents).hexdigest()
+    object_path = objects_dir / digest[:2] / digest[2:]
+    if not object_path.exists():
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = object_path.with_name(f"{digest[2:]}.{os.getpid()}")
+        tmp_path.write_bytes(contents)
+        tmp_path.chmod(0o444)
+        os.replace(tmp_path, object_path)
+
+    return object_path
+
+
+def copy_file_with_replacement(src, dest, random_suffix, another_elm_version,
+                               files):
+    """Rewrite src into dest unless dest already has the right contents.
+
+    `files` maps the path of each customised file (relative to the customised
+    directory) to the hash of its contents and is updated in place. Returns
+    the number of files (re)written.
+
+    """
+    contents = src.read_text().replace(
+        "Platform.Unstable.",
+        f"Platform.Unstable{random_suffix}.",
+    ).replace(
+        'ANOTHER-ELM-VERSION',
+        another_elm_version,
+    ).encode()
 
+    key = str(dest.relative_to(customised_dir))
+    digest = hashlib.sha256(contents).hexdigest()
+    if files.get(key) == digest and dest.is_file():
+        return 0
 
-def copy_dir_with_replacement(src, dest, random_suffix, another_elm_version):
+    dest.unlink(missing_ok=True)
+    link_or_copy(store_object(contents), dest)
+    files[key] = digest
+    return 1
+
+
+def copy_dir_with_replacement(src, dest, random_suffix, another_elm_version,
+                              files):
     dest.mkdir(exist_ok=True)
+    written = 0
+    dest_names = set()
     for entry in os.scandir(src):
         file_suffix = random_suffix if entry.name == 'Unstable' else ''
         dest_name = dest / f"{entry.name}{file_suffix}"
+        dest_names.add(dest_name.name)
         if entry.is_dir():
-            copy_dir_with_replacement(
+            written += copy_dir_with_replacement(
                 src / entry.name,
                 dest_name,
                 random_suffix,
                 another_elm_version,
+                files,
             )
         else:
-            copy_file_with_replacement(
+            written += copy_file_with_replacement(
                 src / entry.name,
                 dest_name,
                 random_suffix,
                 another_elm_version,
+                files,
             )
 
+    # Remove anything whose source has gone (including Unstable directories
+    # with an old suffix).
+    for entry in os.scandir(dest):
+        if entry.name not in dest_names:
+            written += 1
+            if entry.is_dir():
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+            prefix = str(Path(entry.path).relative_to(customised_dir))
+            for key in list(files):
+                if key == prefix or key.startswith(f"{prefix}/"):
+                    del files[key]
+
+    return written
+
+
+def hash_package(custom_package_dir, files):
+    """Hash the files of a customised package.
+
+    The wrapper compares this hash with the one it recorded for each package
+    version it customised to work out which versions are out of date.
+
+    """
+    h = hashlib.sha256()
+    prefix = f"{custom_package_dir.relative_to(customised_dir)}/"
+    for key in sorted(files):
+        if key.startswith(prefix):
+            h.update(key[len(prefix):].encode())
+            h.update(b'\0')
+            h.update(files[key].encode())
+            h.update(b'\0')
+    return h.hexdigest()
+
 
 def reset_package(
-    packages_roots,
     author,
     package,
     random,
     another_elm_version,
+    files,
 ):
     local_package_dir = elm_std_dir / package
     local_src_dir = local_package_dir / "src"
@@ -83,35 +185,22 @@ def reset_package(
     custom_json_file = custom_package_dir / "elm.json"
 
     custom_package_dir.mkdir(parents=True, exist_ok=True)
-    copy_dir_with_replacement(
+    written = copy_dir_with_replacement(
         local_src_dir,
         custom_src_dir,
         random,
         another_elm_version,
+        files,
     )
-    copy_file_with_replacement(
+    written += copy_file_with_replacement(
         local_json_file,
         custom_json_file,
         random,
         another_elm_version,
+        files,
     )
-    with open(custom_package_dir / 'custom', 'w'):
-        pass
 
-    for packages_root in packages_roots:
-        versions_dir = packages_root / author / package
-        try:
-            dirs = os.listdir(versions_dir)
-        except FileNotFoundError:
-            dirs = []
-
-        for v in dirs:
-            package_root = versions_dir / v
-
-            try:
-                (package_root / 'custom').unlink()
-            except FileNotFoundError:
-                pass
+    return written
 
 
 def create_executable(path):
@@ -139,57 +228,152 @@ def install_exe(binary, random_suffix, another_elm_version):
         print("WARNING: {} is not in PATH. Please add it!".format(bin_dir),
               file=sys.stderr)
 
-    with create_executable(binary) as f:
-
-        def print_to_file(s):
-            print(s, file=f, end='')
-
-        for line in fileinput.input(elm_std_dir / "another-elm"):
-            if line == "random_suffix = None  # REPLACE ME\n":
-                print_to_file(f'random_suffix = "{random_suffix}"\n')
-            elif line == "another_elm_version = None  # REPLACE ME\n":
-                print_to_file(
-                    f'another_elm_version = "{another_elm_version}"\n', )
-            else:
-                print_to_file(line)
+    # The launcher finds the another_elm package through the config.
+    config_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = config_file.with_name(f"config.json.{os.getpid()}")
+    with open(tmp_path, 'w') as f:
+        json.dump(
+            {
+                "std-dir": str(elm_std_dir),
+                "random-suffix": random_suffix,
+                "another-elm-version": another_elm_version,
+            },
+            f,
+            indent=4,
+            sort_keys=True,
+        )
+    os.replace(tmp_path, config_file)
 
+    with create_executable(binary) as f:
+        f.write((elm_std_dir / "another-elm").read_text())
 
-def update_packages(random, another_elm_version):
-    elm_home_dir = Path(os.getenv('ELM_HOME', default=Path.home() / '.elm'))
-    another_elm_home = elm_home_dir / 'another'
 
+def read_json(path):
     try:
-        elm_versions = os.listdir(another_elm_home)
-    except FileNotFoundError:
-        elm_versions = []
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def unstable_surface_hash():
+    """Hash the parts of the Platform.Unstable modules that other modules use.
+
+    That is the names of the modules and their exposing lists (or the whole
+    module when it exposes everything).
+
+    """
+    h = hashlib.sha256()
+    for path in sorted((elm_std_dir / "core" / "src" / "Platform" /
+                        "Unstable").rglob("*.elm")):
+        source = path.read_text()
+        header = module_header_re.search(source)
+        if header is None or header[1].strip() == "..":
+            surface = source
+        else:
+            surface = " ".join(header[0].split())
+        h.update(path.name.encode())
+        h.update(b'\0')
+        h.update(surface.encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def deterministic_suffix(another_elm_version, salt):
+    """Derive a suffix from everything that goes into the customised packages.
+
+    The suffix only needs to stop user code importing the Platform.Unstable
+    modules by name, which a suffix that changes with every change to the std
+    sources (and with the per-site salt) still does.
+
+    """
+    h = hashlib.sha256()
+    for (_, pkg) in custom_packages:
+        package_dir = elm_std_dir / pkg
+        files = [package_dir / "elm.json", *(package_dir / "src").rglob("*")]
+        for path in sorted(files):
+            if path.is_file():
+                h.update(str(path.relative_to(elm_std_dir)).encode())
+                h.update(b'\0')
+                h.update(path.read_bytes())
+                h.update(b'\0')
+    h.update(another_elm_version.encode())
+    h.update(b'\0')
+    h.update(salt.encode())
+    return h.hexdigest()[:16].upper()
+
+
+def update_packages(random, another_elm_version, unstable_surface, files):
+    hashes = {}
+    written = 0
+    for (author, pkg) in custom_packages:
+        written += reset_package(author, pkg, random, another_elm_version,
+                                 files)
+        hashes[f"{author}/{pkg}"] = {
+            "hash": hash_package(customised_dir / author / pkg, files),
+        }
+
+    # The wrapper recustomises any installed package version whose hash does
+    # not match.
+    with open(customised_dir / "manifest.json", 'w') as f:
+        json.dump(
+            {
+                "random-suffix": random,
+                "another-elm-version": another_elm_version,
+                "unstable-surface": unstable_surface,
+                "packages": hashes,
+            },
+            f,
+            indent=4,
+            sort_keys=True,
+        )
 
-    packages_roots = list(
-        map(lambda elm_version: another_elm_home / elm_version / 'packages',
-            elm_versions))
+    with open(customised_dir / "files.json", 'w') as f:
+        json.dump(files, f, indent=4, sort_keys=True)
 
-    try:
-        shutil.rmtree(customised_dir)
-    except FileNotFoundError:
-        pass
-    for (author, pkg) in [('elm', 'core'), ('elm', 'json'), ('elm', 'browser'),
-                          ('elm', 'html'), ('elm', 'svg'),
-                          ('elm-explorations', 'test'),
-                          ('elm-explorations', 'markdown')]:
-        reset_package(packages_roots, author, pkg, random, another_elm_version)
+    return written
 
 
 def main():
-    r = f"{random.SystemRandom().getrandbits(64):08X}"
+    manifest = read_json(customised_dir / "manifest.json")
+    unstable_surface = unstable_surface_hash()
     another_elm_version = version_string()
-    update_packages(r, another_elm_version)
+
+    if args.deterministic_suffix:
+        r = deterministic_suffix(another_elm_version, args.suffix_salt)
+        reset = args.reset or manifest.get("random-suffix") != r
+    else:
+        r = manifest.get("random-suffix")
+        reset = (args.reset or r is None
+                 or manifest.get("unstable-surface") != unstable_surface)
+        if reset:
+            r = f"{random.SystemRandom().getrandbits(64):08X}"
+
+    if reset:
+        try:
+            shutil.rmtree(customised_dir)
+        except FileNotFoundError:
+            pass
+        files = {}
+    else:
+        files = read_json(customised_dir / "files.json")
+
+    written = update_packages(r, another_elm_version, unstable_surface, files)
 
     exists = binary_path.exists()
     install_exe(binary_path, r, another_elm_version)
 
+    if args.seed_packages:
+        code = subprocess.run([binary_path, '-Z',
+                               '--seed-packages']).returncode
+        if code != 0:
+            print("Seeding the packages failed!", file=sys.stderr)
+            return code
+
     print("Success!", end=' ')
     if exists:
-        print('Reinstalled another-elm to "{}" and reset std packages.'.format(
-            binary_path))
+        print('Reinstalled another-elm to "{}" and updated {} std package '
+              'files.'.format(binary_path, written))
     else:
         print('Installed another-elm to "{}".'.format(binary_path))
 
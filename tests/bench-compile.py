@@ -0,0 +1,236 @@
+#! /usr/bin/env python3
+
+import argparse
+import fnmatch
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import bench_results
+
+TESTS_DIR = Path(__file__).resolve().parent
+
+SCENARIOS = ["cold-elm-home", "cold-elm-stuff", "warm", "edit", "memo-hit"]
+
+# Scenarios that only apply to another-elm. Everywhere else the build memo is
+# turned off (with ANOTHER_ELM_NO_MEMO) so that elm runs in every compile, as
+# it does with the official compiler.
+ANOTHER_ELM_SCENARIOS = ["memo-hit"]
+
+MODES = {"dev": [], "optimize": ["--optimize"]}
+
+parser = argparse.ArgumentParser(
+    description="Compare compile times of another-elm and the official "
+    "compiler")
+
+parser.add_argument('--projects',
+                    nargs='+',
+                    metavar="PATTERN",
+                    help="Only benchmark projects matching one of these "
+                    "patterns (for example hello-world or 'debug/*')",
+                    default=["*"])
+parser.add_argument('--scenarios',
+                    nargs='+',
+                    choices=SCENARIOS,
+                    default=SCENARIOS)
+parser.add_argument('--modes',
+                    nargs='+',
+                    choices=list(MODES),
+                    default=list(MODES))
+parser.add_argument('--runs',
+                    type=int,
+                    help="Number of timed runs of each scenario",
+                    default=3)
+parser.add_argument('--elm',
+                    help="Official elm compiler",
+                    default=os.getenv('ELM', 'elm'))
+parser.add_argument('--another-elm',
+                    help="another-elm wrapper",
+                    default='another-elm')
+bench_results.add_arguments(parser, threshold=0.1)
+
+
+def find_projects(work_dir, patterns):
+    """Yield (name, project dir, entry) for every project to benchmark."""
+    suite = work_dir / "suite"
+    for elm_json in sorted(suite.glob("**/elm.json")):
+        name = str(elm_json.parent.relative_to(suite))
+        if any(fnmatch.fnmatchcase(name, p) for p in patterns):
+            yield (name, elm_json.parent, "Main.elm")
+
+    if any(fnmatch.fnmatchcase("vdom-tests", p) for p in patterns):
+        yield ("vdom-tests", work_dir / "vdom-tests", "src/Main.elm")
+
+
+def copy_projects(work_dir):
+    """Copy the projects so that benchmarking never touches the checkout."""
+    ignore = shutil.ignore_patterns("elm-stuff", "node_modules")
+    shutil.copytree(TESTS_DIR / "sscce-tests" / "suite",
+                    work_dir / "suite",
+                    ignore=ignore)
+    shutil.copytree(TESTS_DIR / "vdom-tests",
+                    work_dir / "vdom-tests",
+                    ignore=ignore)
+
+
+class Bench:
+    def __init__(self, compiler, project, entry, mode_args, work_dir):
+        self.compiler = compiler
+        self.project = project
+        self.entry = project / entry
+        self.command = [
+            compiler, "make", entry, "--output", os.devnull, *mode_args
+        ]
+        self.work_dir = work_dir
+        self.edits = 0
+        self.env = {**os.environ, "ANOTHER_ELM_NO_MEMO": "1"}
+        self.memo_env = {
+            k: v
+            for (k, v) in os.environ.items() if k != "ANOTHER_ELM_NO_MEMO"
+        }
+
+    def compile(self, env=None):
+        """Compile the project, returns the time taken or None on failure."""
+        start = time.perf_counter()
+        code = subprocess.run(self.command,
+                              cwd=self.project,
+                              env=self.env if env is None else env,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode
+        elapsed = time.perf_counter() - start
+        return elapsed if code == 0 else None
+
+    def clear_elm_stuff(self):
+        shutil.rmtree(self.project / "elm-stuff", ignore_errors=True)
+
+    def run(self, scenario):
+        """Time one compile in the given scenario."""
+        if scenario == "cold-elm-home":
+            self.clear_elm_stuff()
+            with tempfile.TemporaryDirectory(dir=self.work_dir) as elm_home:
+                return self.compile({**self.env, "ELM_HOME": elm_home})
+
+        if scenario == "memo-hit":
+            return self.compile(self.memo_env)
+        if scenario == "cold-elm-stuff":
+            self.clear_elm_stuff()
+        elif scenario == "edit":
+            self.edits += 1
+            with open(self.entry, 'a') as f:
+                f.write(f"\n-- bench-compile edit {self.edits}\n")
+        return self.compile()
+
+    def prepare(self, scenario):
+        """Get the project into the state the scenario starts from."""
+        if scenario in ("cold-elm-stuff", "warm", "edit"):
+            # Makes sure the packages are downloaded (and for warm and edit
+            # that elm-stuff is up to date).
+            return self.compile() is not None
+        if scenario == "memo-hit":
+            # Records the build in the memo.
+            return self.compile(self.memo_env) is not None
+        return True
+
+
+def summarise(times):
+    return {
+        "runs": times,
+        "median": statistics.median(times),
+        "variance": statistics.variance(times) if len(times) > 1 else 0.0,
+        "min": min(times),
+    }
+
+
+def result_key(result):
+    return (result["project"], result["scenario"], result["compiler"],
+            result["mode"])
+
+
+def compare(results, baseline, threshold):
+    """Print regressions compared to baseline, returns True if any."""
+    regressed = False
+    for (result, old, change) in bench_results.slower(results, baseline,
+                                                      result_key, threshold):
+        regressed = True
+        print("regression: {} {} {} {}: {:.1f}ms -> {:.1f}ms ({:+.0%})".format(
+            *result_key(result), old["median"] * 1000, result["median"] * 1000,
+            change))
+    return regressed
+
+
+def print_table(results):
+    print(f"{'project':<36} {'scenario':<15} {'mode':<9} "
+          f"{'elm':>9} {'another':>9} {'overhead':>9}")
+    rows = {}
+    for result in results:
+        (project, scenario, compiler, mode) = result_key(result)
+        rows.setdefault((project, scenario, mode), {})[compiler] = result
+
+    def cell(result):
+        if result is None or "median" not in result:
+            return f"{'-':>9}"
+        return f"{result['median'] * 1000:>7.1f}ms"
+
+    for ((project, scenario, mode), by_compiler) in rows.items():
+        elm = by_compiler.get("elm")
+        another = by_compiler.get("another-elm")
+        overhead = f"{'-':>9}"
+        if elm and another and "median" in elm and "median" in another:
+            overhead = "{:>7.1f}ms".format(
+                (another["median"] - elm["median"]) * 1000)
+        print(f"{project:<36} {scenario:<15} {mode:<9} {cell(elm)} "
+              f"{cell(another)} {overhead}")
+
+
+def main():
+    args = parser.parse_args()
+    compilers = {"elm": args.elm, "another-elm": args.another_elm}
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        copy_projects(work_dir)
+
+        for (name, project, entry) in find_projects(work_dir, args.projects):
+            for (compiler_name, compiler) in compilers.items():
+                for mode in args.modes:
+                    bench = Bench(compiler, project, entry, MODES[mode],
+                                  work_dir)
+                    for scenario in args.scenarios:
+                        if (scenario in ANOTHER_ELM_SCENARIOS
+                                and compiler_name != "another-elm"):
+                            continue
+                        print(f"{name} {scenario} {compiler_name} {mode}",
+                              file=sys.stderr)
+                        result = {
+                            "project": name,
+                            "scenario": scenario,
+                            "compiler": compiler_name,
+                            "mode": mode,
+                        }
+                        times = []
+                        if bench.prepare(scenario):
+                            for _ in range(args.runs):
+                                elapsed = bench.run(scenario)
+                                if elapsed is None:
+                                    break
+                                times.append(elapsed)
+
+                        if len(times) == args.runs and times:
+                            result.update(summarise(times))
+                        else:
+                            result["failed"] = True
+                        results.append(result)
+
+    print_table(results)
+
+    return bench_results.save_and_compare(args, results, compare)
+
+
+if __name__ == '__main__':
+    exit(main())
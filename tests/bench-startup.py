@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import bench_results
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# The modules each path through the another-elm launcher imports (see
+# another_elm/cli.py), besides what the launcher itself imports.
+PATHS = {
+    "interpreter": [],
+    "daemon client": ["another_elm.cli", "another_elm.client"],
+    "compile": ["another_elm.cli", "another_elm.compiler"],
+    "watch": ["another_elm.cli", "another_elm.watch"],
+    "daemon": ["another_elm.cli", "another_elm.daemon"],
+    "gc, make-many": ["another_elm.cli", "another_elm.commands"],
+}
+
+LAUNCHER_IMPORTS = ["json", "os", "sys"]
+
+parser = argparse.ArgumentParser(
+    description="Measure the import time of each path through the "
+    "another-elm launcher with python -X importtime")
+
+parser.add_argument('--runs',
+                    type=int,
+                    help="Number of timed runs of each path",
+                    default=10)
+parser.add_argument('--top',
+                    type=int,
+                    help="Show the N slowest modules of each path",
+                    metavar="N",
+                    default=5)
+bench_results.add_arguments(parser, threshold=0.2)
+
+
+def import_times(modules):
+    """Import modules in a fresh interpreter.
+
+    Returns the total import time in seconds (including the modules python
+    imports at startup) and the self time of each module imported.
+
+    """
+    code = "; ".join(f"import {m}" for m in LAUNCHER_IMPORTS + modules)
+    env = {**os.environ, "PYTHONPATH": str(ROOT_DIR)}
+    # Installs run from cached bytecode.
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        stderr=subprocess.PIPE,
+        check=True,
+    ).stderr.decode()
+
+    total = 0
+    self_times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        (self_us, cumulative_us, name) = line[len("import time:"):].split("|")
+        self_times[name.strip()] = int(self_us) / 1e6
+        # Top level imports include the time of the imports they trigger.
+        if not name.startswith("  "):
+            total += int(cumulative_us) / 1e6
+    return (total, self_times)
+
+
+def measure(modules, runs):
+    # Writes the bytecode caches.
+    import_times(modules)
+
+    totals = []
+    self_times = {}
+    for _ in range(runs):
+        (total, times) = import_times(modules)
+        totals.append(total)
+        for (name, seconds) in times.items():
+            self_times.setdefault(name, []).append(seconds)
+
+    return {
+        "runs": totals,
+        "median": statistics.median(totals),
+        "min": min(totals),
+        "modules": {
+            name: statistics.median(times)
+            for (name, times) in self_times.items()
+        },
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print regressions compared to baseline, returns True if any."""
+    regressed = False
+    for (result, old, change) in bench_results.slower(results, baseline,
+                                                      lambda r: r["path"],
+                                                      threshold):
+        regressed = True
+        print("regression: {}: {:.1f}ms -> {:.1f}ms ({:+.0%})".format(
+            result["path"], old["median"] * 1000, result["median"] * 1000,
+            change))
+
+    base = {r["path"]: r for r in baseline["results"]}
+    for result in results:
+        old = base.get(result["path"])
+        if old is None:
+            continue
+        new_modules = sorted(set(result["modules"]) - set(old["modules"]))
+        if new_modules:
+            print(f"{result['path']} now imports {', '.join(new_modules)}")
+    return regressed
+
+
+def print_table(results, top):
+    interpreter = results[0]["median"]
+    print(f"{'path':<15} {'imports':>9} {'overhead':>9} {'modules':>8}  "
+          "slowest modules")
+    for result in results:
+        slowest = sorted(result["modules"].items(), key=lambda m: -m[1])
+        print(f"{result['path']:<15} {result['median'] * 1000:>7.1f}ms "
+              f"{(result['median'] - interpreter) * 1000:>7.1f}ms "
+              f"{len(result['modules']):>8}  " +
+              ", ".join(f"{name} {seconds * 1000:.1f}ms"
+                        for (name, seconds) in slowest[:top]))
+
+
+def main():
+    args = parser.parse_args()
+
+    results = []
+    for (path, modules) in PATHS.items():
+        print(path, file=sys.stderr)
+        results.append({"path": path, **measure(modules, args.runs)})
+
+    print_table(results, args.top)
+
+    return bench_results.save_and_compare(args, results, compare)
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,70 @@
+"""Save benchmark results and compare them with a baseline.
+
+Used by bench-compile.py and bench-startup.py. Their results are JSON
+objects with a "results" list, each result has the "median" of its runs
+unless it failed.
+
+"""
+
+import json
+import sys
+from pathlib import Path
+
+
+def add_arguments(parser, threshold):
+    """Add --output, --baseline and --threshold to parser."""
+    parser.add_argument('--output',
+                        type=Path,
+                        help="Write the results as JSON to this file")
+    parser.add_argument('--baseline',
+                        type=Path,
+                        help="Compare with the results in this file (written "
+                        "by an earlier --output)")
+    parser.add_argument('--threshold',
+                        type=float,
+                        help="Fail if a median is this fraction slower than "
+                        "the baseline (default: %(default)s)",
+                        default=threshold)
+
+
+def slower(results, baseline, key, threshold):
+    """Yield (result, baseline result, change) for each slower result.
+
+    Results are matched with the baseline by `key`. A result is slower if its
+    median is more than `threshold` (a fraction) above the baseline's.
+
+    """
+    base = {key(r): r for r in baseline["results"] if "median" in r}
+    for result in results:
+        old = base.get(key(result))
+        if old is None or "median" not in result:
+            continue
+        change = result["median"] / old["median"] - 1
+        if change > threshold:
+            yield (result, old, change)
+
+
+def save_and_compare(args, results, compare):
+    """Write results to args.output and compare them with args.baseline.
+
+    `compare(results, baseline, threshold)` prints the regressions and
+    returns True if there are any. Returns the exit code of the benchmark.
+
+    """
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({"results": results}, f, indent=4)
+
+    if args.baseline is not None:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"{Path(sys.argv[0]).name}: no baseline at {args.baseline}",
+                  file=sys.stderr)
+            return 0
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
@@ -2,11 +2,11 @@
 
 const path = require("path");
 const fs = require("fs");
-const readline = require("readline");
+const crypto = require("crypto");
 
 const HELP = `
 
-Usage: check-kernel-imports PACKAGES ...
+Usage: check-kernel-imports [--index FILE] [--dependents MODULE] PACKAGES ...
 
 Where PACKAGES are paths to one or more elm packages. check-kernel-imports
 checks that:
@@ -31,10 +31,21 @@ Restrictions on kernel imports not checked:
 1. You cannot import an elm file from another package unless it is exposed.
 
 Options:
--h, --help     display this help and exit
+--index FILE          keep the facts parsed from each file in the JSON index
+                      FILE and only parse files that changed since the last
+                      run (tests/generate-globals.py can read the index too)
+--dependents MODULE   instead of checking, list the files that import or call
+                      the kernel module MODULE (for example Elm.Kernel.Json)
+-h, --help            display this help and exit
 
 `.trim();
 
+// Bump when the facts recorded for a file change.
+const INDEX_VERSION = 1;
+
+const jsImportRegex =
+  /import\s+((?:[.\w]+\.)?(\w+))\s+(?:as (\w+)\s+)?exposing\s+\((\w+(?:,\s+\w+)*)\)/;
+
 /* Future additions:
  *
  * * Check we do not use Bool in kernel interop.
@@ -87,26 +98,31 @@ function addCall(map, call, location) {
   callArray.push(location);
 }
 
-async function* withLineNumbers(rl) {
-  let i = 1;
-  for await (const line of rl) {
-    yield { line, number: i };
-    i += 1;
+function* withLineNumbers(contents) {
+  const lines = contents.split("\n");
+  if (lines[lines.length - 1] === "") {
+    lines.pop();
   }
-}
 
-async function processElmFile(file, elmDefinitions, kernelCalls) {
-  const lines = withLineNumbers(
-    readline.createInterface({
-      input: fs.createReadStream(file),
-    })
-  );
+  for (const [i, line] of lines.entries()) {
+    yield { line: line.replace(/\r$/u, ""), number: i + 1 };
+  }
+}
 
+/* Parse an elm file.
+ *
+ * Returns the facts check-kernel-imports needs from the file: the errors and
+ * warnings local to the file, the elm definitions it makes and the kernel
+ * calls it makes (as [call, lineNumber] pairs).
+ */
+function processElmFile(file, contents) {
   let moduleName = null;
   const kernelImports = new Map();
 
   const errors = [];
   const warnings = [];
+  const elmDefinitions = new Set();
+  const kernelCalls = [];
 
   function addDef(defName, lineNumber) {
     if (moduleName === null) {
@@ -118,7 +134,7 @@ async function processElmFile(file, elmDefinitions, kernelCalls) {
     elmDefinitions.add(`${moduleName}.${defName}`);
   }
 
-  for await (const { number, line } of lines) {
+  for (const { number, line } of withLineNumbers(contents)) {
     const moduleNameMatch = line.match(/module\s*(\S+)\s.*exposing/u);
     // Ignore all but the first module line, some comments include example elm
     // files which cause multiple matches here. In these cases it is the first
@@ -166,7 +182,7 @@ async function processElmFile(file, elmDefinitions, kernelCalls) {
         importFacts.used = true;
       }
 
-      addCall(kernelCalls, kernelCall, new CallLocation(file, number));
+      kernelCalls.push([kernelCall, number]);
     }
   }
 
@@ -176,31 +192,47 @@ async function processElmFile(file, elmDefinitions, kernelCalls) {
     }
   }
 
-  return { errors, warnings };
+  return {
+    errors,
+    warnings,
+    elmDefinitions: [...elmDefinitions],
+    kernelCalls,
+    kernelImports: [...kernelImports.keys()],
+  };
 }
 
-async function processJsFile(file, importedDefs, kernelDefinitions) {
-  const lines = withLineNumbers(
-    readline.createInterface({
-      input: fs.createReadStream(file),
-    })
-  );
-
+/* Parse a kernel javascript file.
+ *
+ * Returns the facts check-kernel-imports needs from the file: the errors and
+ * warnings local to the file, the kernel definitions it exposes and the
+ * definitions it imports (as [fullElmPath, lineNumber] pairs). Also records
+ * every import line in the file for tests/generate-globals.py.
+ */
+function processJsFile(file, contents) {
   const moduleName = path.basename(file, ".js");
 
   const imports = new Map();
 
   const errors = [];
   const warnings = [];
+  const kernelDefinitions = new Set();
+  const importedDefs = [];
+  const importLines = [];
 
   let importBlockFound = 0;
   let inImport = false;
   let lastImportLineNumber = 0;
 
-  for await (const { number, line } of lines) {
-    const importMatch = line.match(
-      /import\s+((?:[.\w]+\.)?(\w+))\s+(?:as (\w+)\s+)?exposing\s+\((\w+(?:,\s+\w+)*)\)/
-    );
+  for (const { number, line } of withLineNumbers(contents)) {
+    const importMatch = line.match(jsImportRegex);
+    if (importMatch !== null) {
+      importLines.push({
+        line: number,
+        module: importMatch[1],
+        alias: importMatch[3] === undefined ? null : importMatch[3],
+        exposing: importMatch[4].split(",").map((s) => s.trim()),
+      });
+    }
 
     if (!importBlockFound && line === "/*") {
       importBlockFound = true;
@@ -232,8 +264,7 @@ async function processJsFile(file, importedDefs, kernelDefinitions) {
         for (const defName of importMatch[4].split(",").map((s) => s.trim())) {
           imports.set(`__${moduleAlias}_${defName}`, { lineNumber: number, used: false });
 
-          const callFullPath = `${importedModulePath}.${defName}`;
-          addCall(importedDefs, callFullPath, new CallLocation(file, number));
+          importedDefs.push([`${importedModulePath}.${defName}`, number]);
         }
 
         lastImportLineNumber = number;
@@ -325,7 +356,101 @@ async function processJsFile(file, importedDefs, kernelDefinitions) {
     }
   }
 
-  return { errors, warnings };
+  return {
+    errors,
+    warnings,
+    kernelDefinitions: [...kernelDefinitions],
+    importedDefs,
+    imports: importLines,
+  };
+}
+
+async function readIndex(indexPath) {
+  try {
+    const index = JSON.parse(await fs.promises.readFile(indexPath, "utf8"));
+    if (index.version === INDEX_VERSION) {
+      return index;
+    }
+  } catch (error) {
+    if (error.code !== "ENOENT" && !(error instanceof SyntaxError)) {
+      throw error;
+    }
+  }
+
+  return { version: INDEX_VERSION, files: {} };
+}
+
+async function writeIndex(indexPath, index) {
+  const temporaryPath = `${indexPath}.${process.pid}`;
+  await fs.promises.mkdir(path.dirname(indexPath), { recursive: true });
+  await fs.promises.writeFile(temporaryPath, JSON.stringify(index));
+  await fs.promises.rename(temporaryPath, indexPath);
+}
+
+/* Get the facts about file, from the index if the file has not changed.
+ *
+ * Files are looked up by modification time and size first and then by the
+ * hash of their contents. Returns null for files that are neither elm nor
+ * javascript.
+ */
+async function getFacts(index, seen, file) {
+  const extname = path.extname(file);
+  if (extname !== ".elm" && extname !== ".js") {
+    return null;
+  }
+
+  seen[file] = index.files[file];
+  const stat = await fs.promises.stat(file);
+  if (
+    seen[file] !== undefined &&
+    seen[file].mtimeMs === stat.mtimeMs &&
+    seen[file].size === stat.size
+  ) {
+    return seen[file].facts;
+  }
+
+  const contents = await fs.promises.readFile(file);
+  const hash = crypto.createHash("sha256").update(contents).digest("hex");
+  if (seen[file] === undefined || seen[file].hash !== hash) {
+    const text = contents.toString("utf8");
+    const facts = extname === ".elm" ? processElmFile(file, text) : processJsFile(file, text);
+    seen[file] = { hash, facts };
+  }
+
+  seen[file].mtimeMs = stat.mtimeMs;
+  seen[file].size = stat.size;
+  return seen[file].facts;
+}
+
+function printDependents(files, kernelModule) {
+  if (!kernelModule.startsWith("Elm.Kernel.")) {
+    kernelModule = `Elm.Kernel.${kernelModule}`;
+  }
+
+  for (const [file, { facts }] of Object.entries(files)) {
+    const dependsOn =
+      facts.imports === undefined
+        ? facts.kernelImports.includes(kernelModule)
+        : facts.imports.some(({ module }) => module === kernelModule);
+    if (dependsOn) {
+      console.log(file);
+    }
+  }
+}
+
+function takeOption(args, name) {
+  const i = args.indexOf(name);
+  if (i === -1) {
+    return null;
+  }
+
+  const [, value] = args.splice(i, 2);
+  if (value === undefined) {
+    console.error(`check-kernel-imports: error! ${name} needs a value`);
+    process.exit(1);
+  }
+
+  return value;
 }
 
 async function main() {
@@ -340,6 +465,12 @@ async function main() {
   }
 
   const sourceDirs = process.argv.slice(2);
+  const indexPath = takeOption(sourceDirs, "--index");
+  const dependentsOf = takeOption(sourceDirs, "--dependents");
+
+  const index = indexPath === null ? { files: {} } : await readIndex(indexPath);
+  // The index entries of the files we find this time.
+  const seen = {};
 
   // Keys: kernel definition full elm path
   const kernelDefinitions = new Set();
@@ -354,16 +485,46 @@ async function main() {
   const allWarnings = [];
 
   for await (const f of asyncFlatMap(sourceDirs, getSrcFiles)) {
-    const extname = path.extname(f);
-    if (extname === ".elm") {
-      const { errors, warnings } = await processElmFile(f, elmDefinitions, kernelCalls);
-      allErrors.push(...errors);
-      allWarnings.push(...warnings);
-    } else if (extname === ".js") {
-      const { errors, warnings } = await processJsFile(f, elmCallsFromKernel, kernelDefinitions);
-      allErrors.push(...errors);
-      allWarnings.push(...warnings);
+    const facts = await getFacts(index, seen, f);
+    if (facts === null) {
+      continue;
     }
+
+    allErrors.push(...facts.errors);
+    allWarnings.push(...facts.warnings);
+    if (path.extname(f) === ".elm") {
+      for (const definition of facts.elmDefinitions) {
+        elmDefinitions.add(definition);
+      }
+
+      for (const [call, line] of facts.kernelCalls) {
+        addCall(kernelCalls, call, new CallLocation(f, line));
+      }
+    } else {
+      for (const definition of facts.kernelDefinitions) {
+        kernelDefinitions.add(definition);
+      }
+
+      for (const [call, line] of facts.importedDefs) {
+        addCall(elmCallsFromKernel, call, new CallLocation(f, line));
+      }
+    }
+  }
+
+  if (indexPath !== null) {
+    // Keep the entries of packages we were not asked about this time.
+    const otherFiles = Object.entries(index.files).filter(
+      ([file]) => !sourceDirs.some((dir) => file.startsWith(path.resolve(dir, "src") + path.sep))
+    );
+    await writeIndex(indexPath, {
+      version: INDEX_VERSION,
+      files: { ...Object.fromEntries(otherFiles), ...seen },
+    });
+  }
+
+  if (dependentsOf !== null) {
+    printDependents(seen, dependentsOf);
+    return;
   }
 
   for (const [call, locations] of kernelCalls.entries()) {
@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT = (Path(__file__).resolve().parent / "sscce-tests" / "suite" /
+           "hello-world")
+
+parser = argparse.ArgumentParser(
+    description="Check that the packages another-elm gc deletes are all "
+    "there again after the next compile")
+
+parser.add_argument('--another-elm',
+                    help="another-elm wrapper",
+                    default='another-elm')
+
+
+def compile(another_elm, project, env):
+    subprocess.run([another_elm, "make", "Main.elm", "--output", os.devnull],
+                   cwd=project,
+                   env=env,
+                   check=True)
+
+
+def missing_packages(packages_root, dependencies):
+    """List the dependencies without an elm.json or elm files."""
+    missing = []
+    for (name, version) in dependencies.items():
+        package_root = packages_root / name / version
+        has_sources = any((package_root / "src").rglob("*.elm"))
+        if not ((package_root / "elm.json").is_file() and has_sources):
+            missing.append(f"{name} {version}")
+    return missing
+
+
+def main():
+    args = parser.parse_args()
+
+    with open(PROJECT / "elm.json") as f:
+        elm_json = json.load(f)
+    dependencies = {
+        **elm_json["dependencies"]["direct"],
+        **elm_json["dependencies"]["indirect"],
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        project = work_dir / "project"
+        shutil.copytree(PROJECT,
+                        project,
+                        ignore=shutil.ignore_patterns("elm-stuff"))
+        elm_home = work_dir / "elm-home"
+        env = {**os.environ, "ELM_HOME": str(elm_home)}
+        # Every compile must run elm, by itself.
+        env["ANOTHER_ELM_NO_MEMO"] = "1"
+        env.pop("ANOTHER_ELM_DAEMON", None)
+        env.pop("ANOTHER_ELM_GC_BUDGET", None)
+
+        compile(args.another_elm, project, env)
+
+        gc = [args.another_elm, "gc", "--budget", "0", str(project)]
+        output = subprocess.run(
+            gc,
+            env=env,
+            stdout=subprocess.PIPE,
+            encoding='utf8',
+            check=True,
+        ).stdout
+        print(output, end="")
+        if "/packages/" not in output:
+            print("gc-test.py: gc deleted no package versions",
+                  file=sys.stderr)
+            return 1
+
+        compile(args.another_elm, project, env)
+
+        (packages_root, ) = (elm_home / "another").glob("*/packages")
+        missing = missing_packages(packages_root, dependencies)
+        for package in missing:
+            print(f"gc-test.py: {package} is missing after gc and a compile",
+                  file=sys.stderr)
+        return 1 if missing else 0
+
+
+if __name__ == '__main__':
+    exit(main())
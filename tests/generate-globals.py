@@ -1,20 +1,30 @@
 #! /usr/bin/env python3
 
-import fileinput
+import difflib
+import hashlib
+import io
+import json
 import re
 import sys
 import glob
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 HELP = """
 
-Usage: generate-globals GLOBS ...
+Usage: generate-globals [--check] [--index FILE] GLOBS ...
 
 Parse the imports of kernel files and append suitable eslint global
 comments to it. See
 <https://eslint.org/docs/user-guide/configuring#specifying-globals>.
+Files are only written if their contents change.
 
 Options:
+--check        do not write any files, print a diff and exit with status 1
+               if any file is out of date
+--index FILE   use the imports recorded in the index written by
+               tests/check-kernel-imports.js for files that have not changed
+               since it was written
 -h, --help     display this help and exit
 
 """.strip()
@@ -28,63 +38,146 @@ warning_comment_lines = """
 
 """.strip().split('\n')
 
-import_re = (r"import\s+((?:[.\w]+\.)?(\w+))\s+(?:as (\w+)\s+)?"
-             r"exposing\s+\((\w+(?:,\s+\w+)*)\)")
+# Must match INDEX_VERSION in tests/check-kernel-imports.js.
+INDEX_VERSION = 1
 
+import_re = re.compile(r"import\s+((?:[.\w]+\.)?(\w+))\s+(?:as (\w+)\s+)?"
+                       r"exposing\s+\((\w+(?:,\s+\w+)*)\)")
 
-def globalsFromImportMatch(module_name, import_match):
-    # Use alias if it is there, otherwise use last part of
-    # import.
-    moduleAlias = import_match[3]
-    if moduleAlias is None:
-        moduleAlias = import_match[2]
 
+def globalsFromImport(module_name, moduleAlias, defNames):
     vars = map(
         lambda defName: "__{}_{}".format(moduleAlias, defName),
         filter(
             lambda defName:
             not (module_name == "Browser" and moduleAlias == "VirtualDom" and
-                 defName == "divertHrefToApp"),
-            map(lambda defName: defName.strip(), import_match[4].split(","))),
+                 defName == "divertHrefToApp"), defNames),
     )
 
     return "/* global {} */".format(", ".join(vars))
 
 
-def processFile(file):
+def globalsFromImportMatch(module_name, import_match):
+    # Use alias if it is there, otherwise use last part of
+    # import.
+    moduleAlias = import_match[3]
+    if moduleAlias is None:
+        moduleAlias = import_match[2]
+
+    return globalsFromImport(
+        module_name, moduleAlias,
+        map(lambda defName: defName.strip(), import_match[4].split(",")))
+
+
+def globalsFromIndexedImport(module_name, indexed_import):
+    moduleAlias = indexed_import["alias"]
+    if moduleAlias is None:
+        moduleAlias = indexed_import["module"].split(".")[-1]
+
+    return globalsFromImport(module_name, moduleAlias,
+                             indexed_import["exposing"])
+
+
+def readIndex(index_path):
+    """Read the files recorded in the index of check-kernel-imports.js."""
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index["files"]
+
+
+def generateContents(file, old_contents, indexed_imports=None):
+    """Generate the new contents of file.
+
+    If the file's imports are known from the index they are used instead of
+    searching each line for imports.
+
+    """
     globals = []
+    lines = []
 
     module_name = Path(file).stem
 
     last_line_empty = False
 
-    with fileinput.input(file, inplace=True) as f:
-        for line in f:
-            if line.startswith(warning_comment_lines[0]):
-                break
-            else:
-                print(line, end='')
-                last_line_empty = line.strip() == ''
-                import_match = re.search(import_re, line)
+    for line in io.StringIO(old_contents):
+        if line.startswith(warning_comment_lines[0]):
+            break
+        else:
+            lines.append(line)
+            last_line_empty = line.strip() == ''
+            if indexed_imports is not None:
+                continue
 
-                if import_match is not None:
-                    globals.append(
-                        globalsFromImportMatch(module_name, import_match))
+            import_match = import_re.search(line)
+
+            if import_match is not None:
+                globals.append(
+                    globalsFromImportMatch(module_name, import_match))
+
+    if indexed_imports is not None:
+        globals = [
+            globalsFromIndexedImport(module_name, indexed_import)
+            for indexed_import in indexed_imports
+            if indexed_import["line"] <= len(lines)
+        ]
 
     unused_var_config = '{{ "varsIgnorePattern": "_{}_.*" }}'.format(
         module_name)
 
-    with open(file, "a") as f:
-        if not last_line_empty:
-            print(file=f)
+    if not last_line_empty:
+        lines.append("\n")
+
+    lines.append("\n".join(warning_comment_lines) + "\n")
+    lines.append("\n")
+    lines.append('/* eslint no-unused-vars: ["error", {}] */\n'.format(
+        unused_var_config))
+    lines.append("\n")
+    lines.append("\n".join(globals) + "\n")
+
+    return "".join(lines)
+
+
+def processFile(file, check, index):
+    """Update the globals of file.
+
+    Returns False if they are up to date, otherwise True (or a diff when
+    checking).
+
+    """
+    with open(file, 'rb') as f:
+        raw_contents = f.read()
+    old_contents = raw_contents.decode()
+
+    indexed_imports = None
+    entry = index.get(str(Path(file).resolve()))
+    if (entry is not None
+            and entry["hash"] == hashlib.sha256(raw_contents).hexdigest()):
+        indexed_imports = entry["facts"]["imports"]
+
+    new_contents = generateContents(file, old_contents, indexed_imports)
+
+    if new_contents == old_contents:
+        return False
+
+    if check:
+        diff = difflib.unified_diff(
+            old_contents.splitlines(keepends=True),
+            new_contents.splitlines(keepends=True),
+            fromfile=file,
+            tofile=file,
+        )
+        return "".join(diff)
+
+    with open(file, "w") as f:
+        f.write(new_contents)
 
-        print("\n".join(warning_comment_lines), file=f)
-        print(file=f)
-        print('/* eslint no-unused-vars: ["error", {}] */'.format(
-            unused_var_config),
-              file=f)
-        print(file=f)
-        print("\n".join(globals), file=f)
+    return True
 
 
 def main():
@@ -97,9 +190,43 @@ def main():
         print(HELP)
         exit(0)
 
-    for provided_glob in sys.argv[1:]:
-        for path in glob.glob(provided_glob, recursive=True):
-            processFile(path)
+    args = sys.argv[1:]
+    check = "--check" in args
+    if check:
+        args.remove("--check")
+
+    index = {}
+    if "--index" in args:
+        i = args.index("--index")
+        if i + 1 == len(args):
+            print("generate-globals.py: error! --index needs a file",
+                  file=sys.stderr)
+            exit(1)
+        index = readIndex(args[i + 1])
+        del args[i:i + 2]
+
+    globs = args
+
+    paths = [
+        path for provided_glob in globs
+        for path in glob.glob(provided_glob, recursive=True)
+    ]
+
+    with ThreadPoolExecutor() as executor:
+        results = list(
+            executor.map(lambda path: processFile(path, check, index), paths))
+
+    if check:
+        for diff in results:
+            if diff:
+                print(diff, end='')
+
+        if any(results):
+            print(
+                "generate-globals.py: globals are out of date, "
+                "run ./x.py tidy",
+                file=sys.stderr)
+            exit(1)
 
 
 main()
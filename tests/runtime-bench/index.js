@@ -0,0 +1,269 @@
+#! /usr/bin/env node
+
+const childProcess = require("child_process");
+const fs = require("fs");
+const path = require("path");
+
+const HELP = `
+
+Usage: runtime-bench [OPTIONS]
+
+Compile src/Bench.elm (with --optimize) using each compiler, run the
+benchmarks it contains under node and print how many operations per second
+each compiler's output manages.
+
+Options:
+--compilers LIST   comma separated compilers to compare
+                   (default: elm,another-elm)
+--filter TEXT      only run benchmarks whose name contains TEXT
+--samples N        number of timed samples of each benchmark (default: 5)
+--time MS          minimum duration of each sample (default: 200)
+--output FILE      write the results as JSON to FILE
+--baseline FILE    compare with the results in FILE (written by an earlier
+                   --output) and exit with status 1 if a benchmark got slower
+--threshold X      fraction of the baseline's ops/sec a benchmark may lose
+                   before it counts as slower (default: 0.1)
+-h, --help         display this help and exit
+
+`.trim();
+
+const BENCHMARKS = [
+  // _List_fromArray
+  "List literal",
+  // _List_sortWith (and so _List_toArray)
+  "List.sortWith",
+  // _String_fromList
+  "String.fromList",
+  "String.split/join",
+  "String.toUpper",
+  "String.fromInt",
+  // json/src/Elm/Kernel/Json.js
+  "Json.Decode",
+  "Json.Encode",
+  // Scheduler.js
+  "Process.spawn",
+  // A message sent to the app by a task each iteration (Channel.js in
+  // another-elm).
+  "message passing",
+  // As many tasks as iterations started at once by one Cmd.batch, each
+  // sending a message to the app (the run queue of Scheduler.js and the
+  // mailboxes of Channel.js in another-elm).
+  "message burst",
+];
+
+function parseArgs(argv) {
+  const options = {
+    compilers: ["elm", "another-elm"],
+    filter: "",
+    samples: 5,
+    time: 200,
+    output: null,
+    baseline: null,
+    threshold: 0.1,
+  };
+
+  for (let i = 0; i < argv.length; i += 2) {
+    const [option, value] = [argv[i], argv[i + 1]];
+    if (option === "-h" || option === "--help") {
+      console.log(HELP);
+      process.exit(0);
+    }
+
+    if (value === undefined) {
+      console.error(`runtime-bench: error! ${option} needs a value`);
+      process.exit(1);
+    }
+
+    switch (option) {
+      case "--compilers":
+        options.compilers = value.split(",");
+        break;
+      case "--filter":
+        options.filter = value;
+        break;
+      case "--samples":
+      case "--time":
+      case "--threshold":
+        options[option.slice(2)] = Number(value);
+        break;
+      case "--output":
+      case "--baseline":
+        options[option.slice(2)] = value;
+        break;
+      default:
+        console.error(`runtime-bench: error! unknown option ${option}`);
+        process.exit(1);
+    }
+  }
+
+  return options;
+}
+
+function compile(compiler) {
+  const output = path.join(__dirname, "generated", `${path.basename(compiler)}.js`);
+  const result = childProcess.spawnSync(
+    compiler,
+    ["make", "src/Bench.elm", "--optimize", "--output", output],
+    {
+      cwd: __dirname,
+      stdio: ["ignore", "ignore", "inherit"],
+    }
+  );
+  if (result.status !== 0) {
+    throw new Error(`${compiler} failed to compile src/Bench.elm`);
+  }
+
+  return output;
+}
+
+function startApp(file) {
+  // eslint-disable-next-line import/no-dynamic-require
+  const app = require(file).Elm.Bench.init();
+  let pending = null;
+  app.ports.done.subscribe(({ name, check }) => {
+    if (pending === null || pending.name !== name) {
+      throw new Error(`Unexpected reply from benchmark ${name}`);
+    }
+
+    if (check < 0) {
+      pending.reject(new Error(`Unknown benchmark ${name}`));
+    } else {
+      pending.resolve();
+    }
+  });
+
+  // Run a benchmark, resolves to the time taken in seconds.
+  return async (name, iterations) => {
+    const start = process.hrtime.bigint();
+    await new Promise((resolve, reject) => {
+      pending = { name, resolve, reject };
+      app.ports.run.send({ name, iterations });
+    });
+    return Number(process.hrtime.bigint() - start) / 1e9;
+  };
+}
+
+function median(values) {
+  const sorted = [...values].sort((a, b) => a - b);
+  const middle = Math.floor(sorted.length / 2);
+  return sorted.length % 2 === 0 ? (sorted[middle - 1] + sorted[middle]) / 2 : sorted[middle];
+}
+
+async function measure(runBenchmark, name, options) {
+  // Find an iteration count that takes long enough to time accurately.
+  let iterations = 1;
+  // Benchmarks must not overlap, so each run waits for the previous one.
+  // eslint-disable-next-line no-await-in-loop
+  while ((await runBenchmark(name, iterations)) * 1000 < options.time) {
+    iterations *= 2;
+  }
+
+  const samples = [];
+  for (let i = 0; i < options.samples; i += 1) {
+    // eslint-disable-next-line no-await-in-loop
+    samples.push(iterations / (await runBenchmark(name, iterations)));
+  }
+
+  return { opsPerSec: median(samples), samples };
+}
+
+function formatOps(opsPerSec) {
+  return opsPerSec === undefined ? "-" : Math.round(opsPerSec).toLocaleString("en");
+}
+
+function printTable(results, compilers) {
+  const header = ["benchmark", ...compilers];
+  if (compilers.length === 2) {
+    header.push(`${compilers[1]}/${compilers[0]}`);
+  }
+
+  const rows = [header];
+  for (const benchmark of new Set(results.map((r) => r.benchmark))) {
+    const ops = compilers.map(
+      (compiler) =>
+        results.find((r) => r.benchmark === benchmark && r.compiler === compiler).opsPerSec
+    );
+    const row = [benchmark, ...ops.map(formatOps)];
+    if (compilers.length === 2) {
+      row.push(`${(ops[1] / ops[0]).toFixed(2)}x`);
+    }
+
+    rows.push(row);
+  }
+
+  const widths = header.map((_, i) => Math.max(...rows.map((row) => row[i].length)));
+  for (const row of rows) {
+    console.log(
+      row.map((cell, i) => (i === 0 ? cell.padEnd(widths[i]) : cell.padStart(widths[i]))).join("  ")
+    );
+  }
+}
+
+function compareWithBaseline(results, baseline, threshold) {
+  let slower = false;
+  for (const result of results) {
+    const old = baseline.results.find(
+      (r) => r.benchmark === result.benchmark && r.compiler === result.compiler
+    );
+    if (old === undefined) {
+      continue;
+    }
+
+    const change = result.opsPerSec / old.opsPerSec - 1;
+    if (change < -threshold) {
+      slower = true;
+      console.log(
+        `slower: ${result.benchmark} (${result.compiler}): ${formatOps(
+          old.opsPerSec
+        )} -> ${formatOps(result.opsPerSec)} ops/sec (${(change * 100).toFixed(0)}%)`
+      );
+    }
+  }
+
+  return slower;
+}
+
+async function main() {
+  const options = parseArgs(process.argv.slice(2));
+  const benchmarks = BENCHMARKS.filter((name) => name.includes(options.filter));
+
+  const results = [];
+  for (const compiler of options.compilers) {
+    const runBenchmark = startApp(compile(compiler));
+    for (const benchmark of benchmarks) {
+      console.error(`${compiler}: ${benchmark}`);
+      // eslint-disable-next-line no-await-in-loop
+      results.push({ benchmark, compiler, ...(await measure(runBenchmark, benchmark, options)) });
+    }
+  }
+
+  printTable(results, options.compilers);
+
+  if (options.output !== null) {
+    await fs.promises.mkdir(path.dirname(options.output), { recursive: true });
+    await fs.promises.writeFile(options.output, JSON.stringify({ results }, null, 2));
+  }
+
+  if (options.baseline !== null) {
+    let baseline;
+    try {
+      baseline = JSON.parse(await fs.promises.readFile(options.baseline, "utf8"));
+    } catch (error) {
+      if (error.code !== "ENOENT") {
+        throw error;
+      }
+
+      console.error(`runtime-bench: no baseline at ${options.baseline}`);
+      return;
+    }
+
+    if (compareWithBaseline(results, baseline, options.threshold)) {
+      process.exitCode = 1;
+    }
+  }
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exitCode = 1;
+});
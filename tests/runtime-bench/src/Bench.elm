@@ -0,0 +1,186 @@
+port module Bench exposing (main)
+
+{-| Micro benchmarks of the core kernel, driven over ports by index.js.
+
+Each request names a benchmark and how many iterations of it to run. The
+benchmark runs to completion (which for the scheduler and message passing
+benchmarks means after several trips through the runtime) and then replies on
+the `done` port with the name of the benchmark.
+
+-}
+
+import Json.Decode as Decode
+import Json.Encode as Encode
+import Process
+import Task
+
+
+port run : ({ name : String, iterations : Int } -> msg) -> Sub msg
+
+
+port done : { name : String, check : Int } -> Cmd msg
+
+
+type Msg
+    = Run { name : String, iterations : Int }
+    | Ping String Int
+    | Spawned String Int
+    | Burst String
+
+
+{-| The number of messages of the current burst still to arrive.
+-}
+type alias Model =
+    Int
+
+
+main : Program () Model Msg
+main =
+    Platform.worker
+        { init = \() -> ( 0, Cmd.none )
+        , update = update
+        , subscriptions = \_ -> run Run
+        }
+
+
+update : Msg -> Model -> ( Model, Cmd Msg )
+update msg pending =
+    case msg of
+        Run { name, iterations } ->
+            if name == "message burst" then
+                ( iterations
+                , List.repeat iterations (Task.perform (\() -> Burst name) (Task.succeed ()))
+                    |> Cmd.batch
+                )
+
+            else
+                ( pending, start name iterations )
+
+        Ping name remaining ->
+            if remaining <= 0 then
+                ( pending, done { name = name, check = 0 } )
+
+            else
+                ( pending, ping name (remaining - 1) )
+
+        Spawned name count ->
+            ( pending, done { name = name, check = count } )
+
+        Burst name ->
+            if pending <= 1 then
+                ( 0, done { name = name, check = 0 } )
+
+            else
+                ( pending - 1, Cmd.none )
+
+
+start : String -> Int -> Cmd Msg
+start name iterations =
+    case name of
+        "message passing" ->
+            ping name iterations
+
+        "Process.spawn" ->
+            List.repeat iterations (Process.spawn (Task.succeed ()))
+                |> Task.sequence
+                |> Task.perform (\ids -> Spawned name (List.length ids))
+
+        _ ->
+            case List.filter (\( n, _ ) -> n == name) syncBenchmarks of
+                ( _, benchmark ) :: _ ->
+                    done { name = name, check = repeat iterations benchmark 0 }
+
+                [] ->
+                    done { name = name, check = -1 }
+
+
+{-| Send ourselves a message through the runtime.
+-}
+ping : String -> Int -> Cmd Msg
+ping name remaining =
+    Task.perform (\() -> Ping name remaining) (Task.succeed ())
+
+
+{-| Run `f` `n` times, the results are combined so that no work can be skipped.
+-}
+repeat : Int -> (() -> Int) -> Int -> Int
+repeat n f acc =
+    if n <= 0 then
+        acc
+
+    else
+        repeat (n - 1) f (acc + f ())
+
+
+syncBenchmarks : List ( String, () -> Int )
+syncBenchmarks =
+    [ ( "List literal", \() -> List.length [ 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16 ] )
+    , ( "List.sortWith", \() -> List.length (List.sortWith compare unsortedInts) )
+    , ( "String.fromList", \() -> String.length (String.fromList chars) )
+    , ( "String.split/join", \() -> String.length (String.join "," (String.split " " sentence)) )
+    , ( "String.toUpper", \() -> String.length (String.toUpper sentence) )
+    , ( "String.fromInt", \() -> String.length (String.fromInt 1234567) )
+    , ( "Json.Decode", decodePeople )
+    , ( "Json.Encode", \() -> String.length (Encode.encode 0 (Encode.list encodePerson people)) )
+    ]
+
+
+unsortedInts : List Int
+unsortedInts =
+    List.range 1 1000
+        |> List.map (\i -> modBy 1009 (i * 7919))
+
+
+chars : List Char
+chars =
+    List.repeat 1000 'a'
+
+
+sentence : String
+sentence =
+    String.repeat 50 "the quick brown fox jumps over the lazy dog "
+
+
+type alias Person =
+    { name : String
+    , age : Int
+    , tags : List String
+    }
+
+
+people : List Person
+people =
+    List.range 1 100
+        |> List.map (\i -> { name = "person " ++ String.fromInt i, age = i, tags = [ "a", "b", "c" ] })
+
+
+encodePerson : Person -> Encode.Value
+encodePerson person =
+    Encode.object
+        [ ( "name", Encode.string person.name )
+        , ( "age", Encode.int person.age )
+        , ( "tags", Encode.list Encode.string person.tags )
+        ]
+
+
+peopleJson : String
+peopleJson =
+    Encode.encode 0 (Encode.list encodePerson people)
+
+
+personDecoder : Decode.Decoder Person
+personDecoder =
+    Decode.map3 Person
+        (Decode.field "name" Decode.string)
+        (Decode.field "age" Decode.int)
+        (Decode.field "tags" (Decode.list Decode.string))
+
+
+decodePeople : () -> Int
+decodePeople () =
+    case Decode.decodeString (Decode.list personDecoder) peopleJson of
+        Ok decoded ->
+            List.length decoded
+
+        Err _ ->
+            -1
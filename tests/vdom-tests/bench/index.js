@@ -0,0 +1,450 @@
+#! /usr/bin/env node
+
+const childProcess = require("child_process");
+const fs = require("fs");
+const path = require("path");
+const v8 = require("v8");
+const vm = require("vm");
+const { JSDOM } = require("jsdom");
+const runReplacements = require("..");
+
+const HELP = `
+
+Usage: bench/index.js [OPTIONS]
+
+Compile bench/src/VdomBench.elm (with --optimize) using each compiler and, for
+each benchmark, draw a sequence of large or pathological trees in jsdom. Print
+the median time the virtual DOM takes to diff and patch each step, how many DOM
+operations it issues and how much memory it allocates.
+
+Like the tests, the output of each compiler is patched with index.js unless
+the TEST_OFFICIAL_VDOM environment variable is set (the patch only applies to
+the output of the official compiler).
+
+Options:
+--compilers LIST   comma separated compilers to compare
+                   (default: elm,another-elm)
+--filter TEXT      only run benchmarks whose name contains TEXT
+--steps N          number of timed steps of each benchmark (default: 20)
+--warmup N         number of steps to run before timing (default: 5)
+--output FILE      write the results as JSON to FILE
+--baseline FILE    compare with the results in FILE (written by an earlier
+                   --output) and exit with status 1 if a benchmark got slower
+                   or issues more DOM operations
+--threshold X      fraction of the baseline's time a benchmark may lose
+                   before it counts as slower (default: 0.1)
+-h, --help         display this help and exit
+
+`.trim();
+
+const TEST_OFFICIAL_VDOM = !!process.env.TEST_OFFICIAL_VDOM;
+
+const BENCHMARKS = [
+  // 10k rows in a Html.Keyed list.
+  "keyed list: create/clear",
+  "keyed list: swap rows",
+  "keyed list: reverse",
+  "keyed list: shuffle",
+  "keyed list: rotate",
+  "keyed list: remove/insert middle",
+  // 1000 nested divs.
+  "deep nesting: text",
+  "deep nesting: replace subtree",
+  // 1000 Html.Lazy rows.
+  "lazy: all hit",
+  "lazy: all miss",
+  "lazy: 10% miss",
+  // 1000 elements whose facts change every step.
+  "attribute churn",
+  "attribute add/remove",
+  "property churn",
+];
+
+// The functions of the (unpatched) virtual DOM that are timed. The patched
+// virtual DOM never calls them, it morphs the DOM in one go instead.
+const TIMED_FUNCTIONS = {
+  diff: "_VirtualDom_diff",
+  patch: "_VirtualDom_applyPatches",
+};
+
+// Calls to these methods, and to any property setter of these interfaces,
+// count as DOM operations.
+const COUNTED_METHODS = {
+  Node: ["appendChild", "insertBefore", "removeChild", "replaceChild"],
+  Element: [
+    "setAttribute",
+    "setAttributeNS",
+    "removeAttribute",
+    "removeAttributeNS",
+    "append",
+    "prepend",
+    "before",
+    "after",
+    "replaceWith",
+    "remove",
+  ],
+  CharacterData: ["replaceData", "before", "after", "replaceWith", "remove"],
+  EventTarget: ["addEventListener", "removeEventListener"],
+  CSSStyleDeclaration: ["setProperty", "removeProperty"],
+};
+const COUNTED_SETTERS = [
+  "Node",
+  "Element",
+  "HTMLElement",
+  "HTMLInputElement",
+  "CharacterData",
+  "CSSStyleDeclaration",
+];
+
+// Lets us collect garbage before each step without running node with
+// --expose-gc.
+v8.setFlagsFromString("--expose-gc");
+const gc = vm.runInNewContext("gc");
+
+function parseArgs(argv) {
+  const options = {
+    compilers: ["elm", "another-elm"],
+    filter: "",
+    steps: 20,
+    warmup: 5,
+    output: null,
+    baseline: null,
+    threshold: 0.1,
+  };
+
+  for (let i = 0; i < argv.length; i += 2) {
+    const [option, value] = [argv[i], argv[i + 1]];
+    if (option === "-h" || option === "--help") {
+      console.log(HELP);
+      process.exit(0);
+    }
+
+    if (value === undefined) {
+      console.error(`vdom-bench: error! ${option} needs a value`);
+      process.exit(1);
+    }
+
+    switch (option) {
+      case "--compilers":
+        options.compilers = value.split(",");
+        break;
+      case "--filter":
+        options.filter = value;
+        break;
+      case "--steps":
+      case "--warmup":
+      case "--threshold":
+        options[option.slice(2)] = Number(value);
+        break;
+      case "--output":
+      case "--baseline":
+        options[option.slice(2)] = value;
+        break;
+      default:
+        console.error(`vdom-bench: error! unknown option ${option}`);
+        process.exit(1);
+    }
+  }
+
+  return options;
+}
+
+function compile(compiler) {
+  const output = path.join(
+    __dirname,
+    "generated",
+    `${path.basename(compiler)}.js`
+  );
+  const result = childProcess.spawnSync(
+    compiler,
+    ["make", "src/VdomBench.elm", "--optimize", "--output", output],
+    {
+      cwd: __dirname,
+      stdio: ["ignore", "ignore", "inherit"],
+    }
+  );
+  if (result.status !== 0) {
+    throw new Error(`${compiler} failed to compile src/VdomBench.elm`);
+  }
+
+  const code = fs.readFileSync(output, "utf8");
+  return instrument(TEST_OFFICIAL_VDOM ? code : runReplacements(code));
+}
+
+// Replace each timed function with a wrapper (defined by `timers`) that times
+// the original.
+function instrument(code) {
+  return Object.entries(TIMED_FUNCTIONS).reduce(
+    (newCode, [phase, name]) =>
+      newCode.replace(
+        `function ${name}(`,
+        `var ${name} = __vdomBench.time("${phase}", ${name}__untimed);\nfunction ${name}__untimed(`
+      ),
+    code
+  );
+}
+
+function timers() {
+  const totals = { diff: 0, patch: 0 };
+  return {
+    totals,
+    time(phase, f) {
+      return (...args) => {
+        const start = process.hrtime.bigint();
+        try {
+          return f(...args);
+        } finally {
+          totals[phase] += Number(process.hrtime.bigint() - start) / 1e6;
+        }
+      };
+    },
+  };
+}
+
+function countDomOperations(window) {
+  const counts = new Map();
+  const count = (name) => counts.set(name, (counts.get(name) || 0) + 1);
+
+  for (const [name, methods] of Object.entries(COUNTED_METHODS)) {
+    const { prototype } = window[name];
+    for (const method of methods) {
+      const original = prototype[method];
+      prototype[method] = function counted(...args) {
+        count(method);
+        return original.apply(this, args);
+      };
+    }
+  }
+
+  for (const name of COUNTED_SETTERS) {
+    const { prototype } = window[name];
+    const descriptors = Object.getOwnPropertyDescriptors(prototype);
+    for (const [property, descriptor] of Object.entries(descriptors)) {
+      if (descriptor.set !== undefined) {
+        Object.defineProperty(prototype, property, {
+          ...descriptor,
+          set(value) {
+            count(property);
+            descriptor.set.call(this, value);
+          },
+        });
+      }
+    }
+  }
+
+  return counts;
+}
+
+async function waitForFrame(frames) {
+  for (let i = 0; frames.length === 0; i += 1) {
+    if (i === 100) {
+      throw new Error("The app did not request an animation frame");
+    }
+
+    await new Promise((resolve) => setImmediate(resolve));
+  }
+}
+
+// Run the requested animation frames, returns the time taken in milliseconds.
+function runFrames(frames) {
+  const start = process.hrtime.bigint();
+  // Drawing requests one more frame, which does nothing unless the model
+  // changed again.
+  while (frames.length > 0) {
+    for (const callback of frames.splice(0)) {
+      callback(Date.now());
+    }
+  }
+
+  return Number(process.hrtime.bigint() - start) / 1e6;
+}
+
+async function runBenchmark(code, name, options) {
+  const { window } = new JSDOM('<!DOCTYPE html><div id="root"></div>', {
+    runScripts: "outside-only",
+  });
+  const frames = [];
+  window.requestAnimationFrame = (callback) => frames.push(callback);
+  const { totals, time } = timers();
+  window.__vdomBench = { time };
+  const domOperations = countDomOperations(window);
+
+  window.eval(code);
+  const app = window.Elm.VdomBench.init({
+    node: window.document.getElementById("root"),
+  });
+
+  const samples = [];
+  for (let step = 0; step <= options.warmup + options.steps; step += 1) {
+    gc();
+    const heapUsed = process.memoryUsage().heapUsed;
+    totals.diff = 0;
+    totals.patch = 0;
+    domOperations.clear();
+
+    app.ports.run.send({ name, step });
+    await waitForFrame(frames);
+    const frame = runFrames(frames);
+
+    // Step 0 draws the initial tree.
+    if (step > options.warmup) {
+      const operations = Object.fromEntries(domOperations);
+      samples.push({
+        frame,
+        diff: totals.diff,
+        patch: totals.patch,
+        domOperations: Object.values(operations).reduce((a, b) => a + b, 0),
+        operations,
+        allocated: process.memoryUsage().heapUsed - heapUsed,
+      });
+    }
+  }
+
+  window.close();
+
+  const medianOf = (key) => median(samples.map((sample) => sample[key]));
+  return {
+    frame: medianOf("frame"),
+    diff: medianOf("diff"),
+    patch: medianOf("patch"),
+    domOperations: medianOf("domOperations"),
+    allocated: medianOf("allocated"),
+    samples,
+  };
+}
+
+function median(values) {
+  const sorted = [...values].sort((a, b) => a - b);
+  const middle = Math.floor(sorted.length / 2);
+  return sorted.length % 2 === 0
+    ? (sorted[middle - 1] + sorted[middle]) / 2
+    : sorted[middle];
+}
+
+function formatMs(ms) {
+  return ms === 0 ? "-" : `${ms.toFixed(2)}ms`;
+}
+
+function printTable(results) {
+  const header = [
+    "benchmark",
+    "compiler",
+    "frame",
+    "diff",
+    "patch",
+    "DOM ops",
+    "allocated",
+  ];
+  const rows = [
+    header,
+    ...results.map((result) => [
+      result.benchmark,
+      result.compiler,
+      formatMs(result.frame),
+      formatMs(result.diff),
+      formatMs(result.patch),
+      Math.round(result.domOperations).toLocaleString("en"),
+      `${Math.round(result.allocated / 1024).toLocaleString("en")}KiB`,
+    ]),
+  ];
+
+  const widths = header.map((_, i) =>
+    Math.max(...rows.map((row) => row[i].length))
+  );
+  for (const row of rows) {
+    console.log(
+      row
+        .map((cell, i) =>
+          i < 2 ? cell.padEnd(widths[i]) : cell.padStart(widths[i])
+        )
+        .join("  ")
+    );
+  }
+}
+
+function compareWithBaseline(results, baseline, threshold) {
+  let slower = false;
+  for (const result of results) {
+    const old = baseline.results.find(
+      (r) => r.benchmark === result.benchmark && r.compiler === result.compiler
+    );
+    if (old === undefined) {
+      continue;
+    }
+
+    const change = result.frame / old.frame - 1;
+    if (change > threshold) {
+      slower = true;
+      console.log(
+        `slower: ${result.benchmark} (${result.compiler}): ${formatMs(
+          old.frame
+        )} -> ${formatMs(result.frame)} (+${(change * 100).toFixed(0)}%)`
+      );
+    }
+
+    if (result.domOperations > old.domOperations) {
+      slower = true;
+      console.log(
+        `more DOM operations: ${result.benchmark} (${result.compiler}): ${old.domOperations} -> ${result.domOperations}`
+      );
+    }
+  }
+
+  return slower;
+}
+
+async function main() {
+  const options = parseArgs(process.argv.slice(2));
+  const benchmarks = BENCHMARKS.filter((name) =>
+    name.includes(options.filter)
+  );
+
+  const results = [];
+  for (const compiler of options.compilers) {
+    const code = compile(compiler);
+    for (const benchmark of benchmarks) {
+      console.error(`${compiler}: ${benchmark}`);
+      results.push({
+        benchmark,
+        compiler,
+        vdom: TEST_OFFICIAL_VDOM ? "official" : "patched",
+        ...(await runBenchmark(code, benchmark, options)),
+      });
+    }
+  }
+
+  printTable(results);
+
+  if (options.output !== null) {
+    await fs.promises.mkdir(path.dirname(options.output), { recursive: true });
+    await fs.promises.writeFile(
+      options.output,
+      JSON.stringify({ results }, null, 2)
+    );
+  }
+
+  if (options.baseline !== null) {
+    let baseline;
+    try {
+      baseline = JSON.parse(
+        await fs.promises.readFile(options.baseline, "utf8")
+      );
+    } catch (error) {
+      if (error.code !== "ENOENT") {
+        throw error;
+      }
+
+      console.error(`vdom-bench: no baseline at ${options.baseline}`);
+      return;
+    }
+
+    if (compareWithBaseline(results, baseline, options.threshold)) {
+      process.exitCode = 1;
+    }
+  }
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exitCode = 1;
+});
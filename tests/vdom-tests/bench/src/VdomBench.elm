@@ -0,0 +1,266 @@
+port module VdomBench exposing (main)
+
+{-| Virtual DOM benchmarks, driven over ports by index.js.
+
+Each message on the `run` port names a benchmark and a step. The view draws the
+tree the benchmark has at that step and index.js times the animation frame that
+diffs the new tree against the old one and patches the DOM to match.
+
+-}
+
+import Browser
+import Html exposing (Html)
+import Html.Attributes as Attributes
+import Html.Keyed as Keyed
+import Html.Lazy as Lazy
+
+
+port run : ({ name : String, step : Int } -> msg) -> Sub msg
+
+
+type alias Model =
+    { name : String
+    , step : Int
+    }
+
+
+main : Program () Model Model
+main =
+    Browser.element
+        { init = \() -> ( { name = "", step = 0 }, Cmd.none )
+        , update = \model _ -> ( model, Cmd.none )
+        , subscriptions = \_ -> run identity
+        , view = view
+        }
+
+
+view : Model -> Html msg
+view { name, step } =
+    let
+        odd =
+            modBy 2 step == 1
+    in
+    case name of
+        "keyed list: create/clear" ->
+            keyedList
+                (if odd then
+                    []
+
+                 else
+                    rows
+                )
+
+        "keyed list: swap rows" ->
+            keyedList (alternate odd rows swappedRows)
+
+        "keyed list: reverse" ->
+            keyedList (alternate odd rows reversedRows)
+
+        "keyed list: shuffle" ->
+            keyedList (alternate odd rows shuffledRows)
+
+        "keyed list: rotate" ->
+            keyedList (List.drop (modBy rowCount step) rows ++ List.take (modBy rowCount step) rows)
+
+        "keyed list: remove/insert middle" ->
+            keyedList (alternate odd rows rowsWithoutMiddle)
+
+        "deep nesting: text" ->
+            nested nestingDepth (Html.text (String.fromInt step))
+
+        "deep nesting: replace subtree" ->
+            nested (nestingDepth // 2)
+                ((if odd then
+                    Html.section
+
+                  else
+                    Html.div
+                 )
+                    []
+                    [ nested (nestingDepth // 2) (Html.text "leaf") ]
+                )
+
+        "lazy: all hit" ->
+            lazyRows step (\_ -> 0)
+
+        "lazy: all miss" ->
+            lazyRows step (\_ -> step)
+
+        "lazy: 10% miss" ->
+            -- Every step changes the rows whose index ends in the last digit
+            -- of the step.
+            lazyRows step (\i -> step - modBy 10 (step - i))
+
+        "attribute churn" ->
+            Html.div [] (List.map (attributeRow step) items)
+
+        "attribute add/remove" ->
+            Html.div []
+                (List.map
+                    (\i ->
+                        if odd then
+                            Html.div [] []
+
+                        else
+                            attributeRow step i
+                    )
+                    items
+                )
+
+        "property churn" ->
+            Html.div [] (List.map (propertyRow step) items)
+
+        _ ->
+            Html.text ""
+
+
+alternate : Bool -> a -> a -> a
+alternate odd even other =
+    if odd then
+        other
+
+    else
+        even
+
+
+
+-- KEYED LISTS
+
+
+rowCount : Int
+rowCount =
+    10000
+
+
+rows : List Int
+rows =
+    List.range 0 (rowCount - 1)
+
+
+{-| Swap the second and the second to last rows.
+-}
+swappedRows : List Int
+swappedRows =
+    List.map
+        (\i ->
+            if i == 1 then
+                rowCount - 2
+
+            else if i == rowCount - 2 then
+                1
+
+            else
+                i
+        )
+        rows
+
+
+reversedRows : List Int
+reversedRows =
+    List.reverse rows
+
+
+shuffledRows : List Int
+shuffledRows =
+    List.sortBy (\i -> modBy rowCount (i * 7919)) rows
+
+
+{-| Remove a hundred rows from the middle and add a hundred new ones at the
+start.
+-}
+rowsWithoutMiddle : List Int
+rowsWithoutMiddle =
+    List.range rowCount (rowCount + 99)
+        ++ List.filter (\i -> i < rowCount // 2 || i >= rowCount // 2 + 100) rows
+
+
+keyedList : List Int -> Html msg
+keyedList ids =
+    Keyed.node "ul" [] (List.map keyedRow ids)
+
+
+keyedRow : Int -> ( String, Html msg )
+keyedRow i =
+    ( String.fromInt i, Html.li [] [ Html.text (String.fromInt i) ] )
+
+
+
+-- DEEP NESTING
+
+
+nestingDepth : Int
+nestingDepth =
+    1000
+
+
+nested : Int -> Html msg -> Html msg
+nested depth child =
+    if depth <= 0 then
+        child
+
+    else
+        nested (depth - 1) (Html.div [] [ child ])
+
+
+
+-- LAZY
+
+
+items : List Int
+items =
+    List.range 0 999
+
+
+{-| One lazy row for each item, a row is only drawn again when its version
+changes.
+-}
+lazyRows : Int -> (Int -> Int) -> Html msg
+lazyRows step version =
+    Html.div []
+        (Html.text (String.fromInt step)
+            :: List.map (\i -> Lazy.lazy2 lazyRow i (version i)) items
+        )
+
+
+lazyRow : Int -> Int -> Html msg
+lazyRow i version =
+    Html.div [ Attributes.class "row" ]
+        [ Html.span [] [ Html.text (String.fromInt i) ]
+        , Html.span [] [ Html.text (String.fromInt version) ]
+        ]
+
+
+
+-- ATTRIBUTES AND PROPERTIES
+
+
+attributeRow : Int -> Int -> Html msg
+attributeRow step i =
+    Html.div
+        [ Attributes.attribute "data-step" (String.fromInt (step + i))
+        , Attributes.title ("row " ++ String.fromInt i ++ " at step " ++ String.fromInt step)
+        , Attributes.style "color"
+            (if modBy 2 (step + i) == 0 then
+                "red"
+
+             else
+                "blue"
+            )
+        ]
+        []
+
+
+propertyRow : Int -> Int -> Html msg
+propertyRow step i =
+    Html.input
+        [ Attributes.value (String.fromInt (step + i))
+        , Attributes.checked (modBy 2 (step + i) == 0)
+        , Attributes.class
+            (if modBy 3 (step + i) == 0 then
+                "selected"
+
+             else
+                "row"
+            )
+        ]
+        []
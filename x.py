@@ -1,8 +1,21 @@
 #! /usr/bin/env python3
 
 import argparse
+import fnmatch
+import functools
+import hashlib
+import io
+import json
 import os
+import re
+import shutil
+import statistics
 import subprocess
+import sys
+import threading
+import time
+import traceback
+from concurrent import futures
 
 YAPF_VERSION = '0.31.'
 FLAKE8_VERSION = '3.9.'
@@ -14,11 +27,326 @@ NON_CORE_PACKAGES = ["browser", "json", "test", "markdown", "html", "svg"]
 
 PACKAGES = ["core", *NON_CORE_PACKAGES]
 
+# Where the non core packages are staged for building, see `stage_package`.
+STAGING_DIR = os.path.join('.x-cache', 'staging')
+
+KERNEL_GLOBS = [f"./{p}/src/**/*.js" for p in PACKAGES]
+
+# Results of x.py bench and runtime-bench (in compile/ and runtime/
+# subdirectories, latest.json) and the baselines they are compared with.
+BENCH_DIR = os.path.join('.x-cache', 'bench')
+
+# Facts about the kernel imports of each file, written by
+# check-kernel-imports.js and read by generate-globals.py.
+KERNEL_INDEX = os.path.join('.x-cache', 'kernel-index.json')
+
+kernel_import_re = re.compile(rb'^import Elm\.Kernel\.', re.MULTILINE)
+
+# Wall time, child CPU time, peak RSS and exit code of every step run by
+# x.py tidy, check and test, one line per run. Read by x.py report.
+HISTORY = os.path.join('.x-cache', 'history.jsonl')
+
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+# Holds the output buffer and the resource usage of the task running on each
+# thread, see `run_tasks`.
+task_output = threading.local()
+
 
 def remove_prefix(text, prefix):
     return text[text.startswith(prefix) and len(prefix):]
 
 
+class TaskStdout:
+    """Send what tasks print to their own output buffers."""
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def write(self, text):
+        buffer = getattr(task_output, 'buffer', None)
+        return (self.stdout if buffer is None else buffer).write(text)
+
+    def flush(self):
+        self.stdout.flush()
+
+
+class StepCache:
+    """Skip steps whose inputs have not changed since they last passed.
+
+    The inputs of a step are given as fnmatch patterns (so `*` also matches
+    `/`) against the files git knows about (tracked or untracked but not
+    ignored). A step is skipped if the contents of its inputs, the version of
+    the tool it runs and x.py itself are the same as when it last passed.
+
+    """
+    def __init__(self, root_dir, enabled):
+        self.root_dir = root_dir
+        self.enabled = enabled
+        self.path = os.path.join(root_dir, '.x-cache', 'steps.json')
+        self.lock = threading.Lock()
+        self.files = None
+
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def list_files(self):
+        with self.lock:
+            if self.files is None:
+                output = subprocess.run(
+                    ['git', 'ls-files', '-co', '--exclude-standard', '-z'],
+                    cwd=self.root_dir,
+                    stdout=subprocess.PIPE,
+                    check=True)
+                self.files = sorted(set(output.stdout.decode().split('\0')))
+            return self.files
+
+    def hash_inputs(self, inputs, tool_version):
+        digest = hashlib.sha256(tool_version.encode())
+        with open(__file__, 'rb') as f:
+            digest.update(f.read())
+
+        for file in self.list_files():
+            if not any(fnmatch.fnmatchcase(file, p) for p in inputs):
+                continue
+            digest.update(file.encode() + b'\0')
+            try:
+                with open(os.path.join(self.root_dir, file), 'rb') as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+            except FileNotFoundError:
+                digest.update(b'missing')
+
+        return digest.hexdigest()
+
+    def save(self, name, key):
+        with self.lock:
+            self.entries[name] = key
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+    def package_inputs(self, package):
+        """Input patterns for building package (and the packages it uses)."""
+        packages = {package}
+        todo = [package]
+        while todo:
+            with open(os.path.join(self.root_dir, todo.pop(),
+                                   'elm.json')) as f:
+                dependencies = json.load(f)["dependencies"]
+            for dependency in dependencies:
+                dependency = dependency.split('/')[1]
+                if dependency in PACKAGES and dependency not in packages:
+                    packages.add(dependency)
+                    todo.append(dependency)
+
+        return [
+            pattern for p in sorted(packages)
+            for pattern in [f"{p}/src/*", f"{p}/elm.json"]
+        ]
+
+    def step(self, name, step, inputs, tool_version=''):
+        """Wrap step so that it is skipped when its inputs are unchanged."""
+        if not self.enabled:
+            return step
+
+        def cached_step():
+            key = self.hash_inputs(inputs, tool_version)
+            if self.entries.get(name) == key:
+                print(f"{name}: cached")
+                task_output.stats['cached'] = True
+                return False
+
+            code = step()
+
+            # Only remember passes of steps that left their inputs alone (tidy
+            # steps that fixed something are checked again next time).
+            if not code and self.hash_inputs(inputs, tool_version) == key:
+                self.save(name, key)
+            return code
+
+        return cached_step
+
+    def step_needed_by(self, name, step, dependents):
+        """Wrap step so that it is skipped when all of its dependents are.
+
+        `dependents` lists the (name, inputs, tool_version) of the cached
+        steps that need step to have run first.
+
+        """
+        if not self.enabled:
+            return step
+
+        def cached_step():
+            if all(
+                    self.entries.get(dependent) == self.hash_inputs(
+                        inputs, tool_version)
+                    for (dependent, inputs, tool_version) in dependents):
+                print(f"{name}: cached")
+                task_output.stats['cached'] = True
+                return False
+            return step()
+
+        return cached_step
+
+
+def run_task(step, buffered):
+    if buffered:
+        task_output.buffer = io.StringIO()
+    task_output.stats = {'cpu': 0.0, 'max_rss': 0, 'cached': False}
+    start = time.monotonic()
+    try:
+        code = step()
+    except Exception:
+        traceback.print_exc(file=sys.stdout)
+        code = True
+    finally:
+        output = task_output.buffer.getvalue() if buffered else ''
+        task_output.buffer = None
+        stats = task_output.stats
+        task_output.stats = None
+
+    stats.update(wall=time.monotonic() - start, exit=int(code))
+    return (code, output, stats)
+
+
+def wait(process):
+    """Wait for process, adding the resources it used to the task's stats.
+
+    Steps run concurrently so RUSAGE_CHILDREN would mix up their children,
+    os.wait4 gives the usage of this child (and of its own children) alone.
+
+    """
+    (_, status, usage) = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    stats = getattr(task_output, 'stats', None)
+    if stats is not None:
+        stats['cpu'] += usage.ru_utime + usage.ru_stime
+        stats['max_rss'] = max(stats['max_rss'], usage.ru_maxrss * RSS_UNIT)
+
+    return process.returncode
+
+
+def format_seconds(seconds):
+    return f"{seconds:.1f}s"
+
+
+def format_bytes(size):
+    return f"{size / 2**20:.0f}MiB"
+
+
+def print_steps(steps, wall):
+    """Print the stats of each step, slowest first."""
+    width = max([len("total"), *(len(step['name']) for step in steps)])
+    print(f"{'step':<{width}} {'wall':>8} {'cpu':>8} {'max rss':>8} "
+          f"{'exit':>4}")
+    for step in sorted(steps, key=lambda step: step['wall'], reverse=True):
+        cached = " (cached)" if step['cached'] else ""
+        print(f"{step['name']:<{width}} {format_seconds(step['wall']):>8} "
+              f"{format_seconds(step['cpu']):>8} "
+              f"{format_bytes(step['max_rss']):>8} {step['exit']:>4}{cached}")
+    print(f"{'total':<{width}} {format_seconds(wall):>8}")
+
+
+def record_history(root_dir, command, steps, wall):
+    """Append a run of `command` to the history read by x.py report."""
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                            cwd=root_dir,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            encoding='utf8').stdout.strip()
+    entry = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'command': command,
+        'commit': commit,
+        'wall': wall,
+        'steps': steps,
+    }
+
+    path = os.path.join(root_dir, HISTORY)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def run_tasks(tasks, *, jobs, fail_fast=False, record=None):
+    """Run steps concurrently, respecting the order of their dependencies.
+
+    `tasks` maps the name of each task to a tuple of its step (a function
+    returning a truthy value on failure) and the names of the tasks that must
+    finish before it starts. Up to `jobs` steps run at once. The output of each
+    step is buffered and printed once it finishes so that the logs of
+    concurrent steps do not interleave. With `fail_fast` no more steps are
+    started once one fails.
+
+    The wall time, child CPU time, peak RSS and exit code of each step are
+    printed at the end and passed, with the total wall time, to `record`.
+
+    Returns True if any step failed.
+
+    """
+    for (name, (_, dependencies)) in tasks.items():
+        for dependency in dependencies:
+            assert dependency in tasks, f"{name} depends on {dependency}"
+
+    buffered = jobs > 1
+    stdout = sys.stdout
+    if buffered:
+        sys.stdout = TaskStdout(stdout)
+
+    pending = dict(tasks)
+    finished = set()
+    failed = []
+    running = {}
+    steps = []
+    start = time.monotonic()
+    try:
+        with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            while True:
+                if not (fail_fast and failed):
+                    for (name, (step, dependencies)) in list(pending.items()):
+                        if len(running) >= jobs:
+                            break
+                        if finished.issuperset(dependencies):
+                            del pending[name]
+                            future = executor.submit(run_task, step, buffered)
+                            running[future] = name
+
+                if not running:
+                    break
+
+                (done, _) = futures.wait(running,
+                                         return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    (code, output, stats) = future.result()
+                    stdout.write(output)
+                    stdout.flush()
+                    finished.add(name)
+                    steps.append({'name': name, **stats})
+                    if code:
+                        failed.append(name)
+    finally:
+        sys.stdout = stdout
+
+    wall = time.monotonic() - start
+    print_steps(steps, wall)
+    if record is not None:
+        record(steps, wall)
+
+    if pending:
+        print(f"Cancelled: {', '.join(pending)}")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+
+    return bool(failed)
+
+
 def elm_make_core(run):
     print("Running elm make in core...")
     code = run(['elm', "make"], subdir='core')
@@ -29,9 +357,84 @@ def elm_make_core(run):
     return code
 
 
+def write_if_changed(path, contents):
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == contents:
+                return
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'wb') as f:
+        f.write(contents)
+
+
+def stage_package(root_dir, dir, random_suffix):
+    """Copy a package into the staging directory so another-elm can build it.
+
+    Kernel imports are commented out and `Platform.Unstable` gets the random
+    suffix (as init.py does when installing the package). Only files that
+    changed are written so that the elm-stuff of the staged copy stays
+    useful. Returns the staged copy's path relative to root_dir.
+
+    """
+    staged_dir = os.path.join(STAGING_DIR, dir)
+    unstable = rb'Platform.Unstable' + random_suffix.encode() + rb'.'
+
+    staged_files = {os.path.join(staged_dir, 'elm.json')}
+    with open(os.path.join(root_dir, dir, 'elm.json'), 'rb') as f:
+        write_if_changed(os.path.join(root_dir, staged_dir, 'elm.json'),
+                         f.read())
+
+    for (dirpath, _, filenames) in os.walk(os.path.join(root_dir, dir, 'src')):
+        for filename in filenames:
+            src = os.path.join(dirpath, filename)
+            dest = os.path.join(
+                staged_dir, os.path.relpath(src, os.path.join(root_dir, dir)))
+            with open(src, 'rb') as f:
+                contents = f.read()
+            if filename.endswith('.elm'):
+                contents = kernel_import_re.sub(b'-- UNDO import Elm.Kernel.',
+                                                contents)
+                contents = contents.replace(b'Platform.Unstable.', unstable)
+            write_if_changed(os.path.join(root_dir, dest), contents)
+            staged_files.add(dest)
+
+    for (dirpath, _,
+         filenames) in os.walk(os.path.join(root_dir, staged_dir, 'src')):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.relpath(path, root_dir) not in staged_files:
+                os.unlink(path)
+
+    return staged_dir
+
+
+def prime_packages(run):
+    # Why do this? If we run `elm make` in the elm/json package with an empty
+    # $ELM_HOME we get strange compiler ICE (that does not go away until we
+    # delete $ELM_HOME). This probably happens because elm/json has a circular
+    # dependancy on itself via elm/core which must confuse the compiler.
+    print("Priming the another-elm package store...")
+    run(['another-elm', 'make', 'Main.elm', '--output', os.devnull],
+        subdir=os.path.join('tests', 'sscce-tests', 'suite', 'hello-world'))
+
+    return False
+
+
 def elm_make(dir, run):
     print(f"Running elm make in {dir}...")
-    code = run(['../make-pkg.sh'], subdir=dir)
+    output = subprocess.run(
+        ['another-elm', '-Z', '--print-random-suffix'],
+        stdout=subprocess.PIPE,
+        encoding='utf8',
+    )
+    if output.returncode != 0:
+        print("Could not get the random suffix from another-elm")
+        return output.returncode
+
+    staged_dir = stage_package(run.root_dir, dir, output.stdout.strip())
+    code = run(['another-elm', 'make'], subdir=staged_dir)
 
     if code != 0:
         print(f"There are issues with elm make in {dir}")
@@ -39,9 +442,51 @@ def elm_make(dir, run):
     return code
 
 
+def elm_make_tasks(run, cache, dependencies):
+    """The tasks building every package, see `run_tasks`."""
+    inputs = {
+        ncp: [*cache.package_inputs(ncp), "another[-_]elm*"]
+        for ncp in NON_CORE_PACKAGES
+    }
+    return {
+        "elm make core": (
+            cache.step(
+                "elm make core",
+                functools.partial(elm_make_core, run),
+                cache.package_inputs("core"),
+                ELM_VERSION,
+            ),
+            dependencies,
+        ),
+        "prime packages": (
+            cache.step_needed_by(
+                "prime packages",
+                functools.partial(prime_packages, run),
+                [(f"elm make {ncp}", inputs[ncp], ELM_VERSION)
+                 for ncp in NON_CORE_PACKAGES],
+            ),
+            dependencies,
+        ),
+        **{
+            f"elm make {ncp}": (
+                cache.step(
+                    f"elm make {ncp}",
+                    functools.partial(elm_make, ncp, run),
+                    inputs[ncp],
+                    ELM_VERSION,
+                ),
+                ["prime packages"],
+            )
+            for ncp in NON_CORE_PACKAGES
+        },
+    }
+
+
 def check_kernel_imports(run):
     print("Running check-kernel-imports...")
-    code = run(['./tests/check-kernel-imports.js', *PACKAGES])
+    code = run([
+        './tests/check-kernel-imports.js', '--index', KERNEL_INDEX, *PACKAGES
+    ])
 
     if code != 0:
         print("There are kernel import issues")
@@ -77,8 +522,23 @@ def get_runner():
         else:
             cwd = root_dir
 
-        return subprocess.run(args, cwd=cwd, env=env).returncode
-
+        buffer = getattr(task_output, 'buffer', None)
+        if buffer is None:
+            return wait(subprocess.Popen(args, cwd=cwd, env=env))
+
+        process = subprocess.Popen(args,
+                                   cwd=cwd,
+                                   env=env,
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   encoding='utf8',
+                                   errors='replace')
+        with process.stdout:
+            buffer.write(process.stdout.read())
+        return wait(process)
+
+    run.root_dir = root_dir
     return run
 
 
@@ -243,8 +703,8 @@ def tidy():
     def generate_globals():
         print("Running generate-globals...")
         code = run([
-            './tests/generate-globals.py',
-            *map(lambda p: f"./{p}/src/**/*.js", PACKAGES)
+            './tests/generate-globals.py', '--index', KERNEL_INDEX,
+            *KERNEL_GLOBS
         ])
 
         return bool(code)
@@ -258,21 +718,63 @@ def tidy():
         return bool(code)
 
     # Call generate_globals first as sometime xo only passes after
-    # generate_globals runs.
-    code = False
-    code |= elm_make_core(run)
-
-    for ncp in NON_CORE_PACKAGES:
-        code |= elm_make(ncp, run)
-
-    code |= generate_globals()
-    code |= xo()
-    code |= yapf()
-    code |= flake8(run)
-    code |= check_kernel_imports(run)
-    code |= elm_format()
-
-    exit(code)
+    # generate_globals runs. Both rewrite the kernel javascript so they finish
+    # before elm reads it.
+    cache = StepCache(run.root_dir, args.cache)
+    tasks = {
+        "generate globals": (
+            cache.step(
+                "tidy generate globals",
+                generate_globals,
+                ["*/src/*.js", "tests/generate-globals.py"],
+            ),
+            [],
+        ),
+        "xo": (
+            cache.step("tidy xo", xo, ["*.js", "package.json"]),
+            ["generate globals"],
+        ),
+        **elm_make_tasks(run, cache, ["xo"]),
+        "yapf": (
+            cache.step("tidy yapf", yapf, ["*.py"], YAPF_VERSION),
+            [],
+        ),
+        "flake8": (
+            cache.step(
+                "flake8",
+                functools.partial(flake8, run),
+                ["*.py"],
+                FLAKE8_VERSION,
+            ),
+            ["yapf"],
+        ),
+        "check kernel imports": (
+            cache.step(
+                "check kernel imports",
+                functools.partial(check_kernel_imports, run),
+                [
+                    *(f"{p}/src/*" for p in PACKAGES),
+                    "tests/check-kernel-imports.js",
+                ],
+            ),
+            ["xo"],
+        ),
+        "elm-format": (
+            cache.step(
+                "tidy elm-format",
+                elm_format,
+                ["core/src/*.elm", "json/src/*.elm", "tests/tests/*.elm"],
+                ELM_FORMAT_VERSION,
+            ),
+            ["elm make core", "elm make json"],
+        ),
+    }
+
+    exit(
+        run_tasks(tasks,
+                  jobs=args.jobs,
+                  record=functools.partial(record_history, run.root_dir,
+                                           'tidy')))
 
 
 def check():
@@ -302,20 +804,71 @@ def check():
 
         return bool(code)
 
-    fail_fast = args.fail_fast
-    code = False
-    code |= (fail_fast and code) or elm_make_core(run)
+    def generate_globals():
+        print("Checking generate-globals...")
+        code = run([
+            './tests/generate-globals.py', '--check', '--index', KERNEL_INDEX,
+            *KERNEL_GLOBS
+        ])
 
-    for ncp in NON_CORE_PACKAGES:
-        code |= (fail_fast and code) or elm_make(ncp, run)
+        if code != 0:
+            print("generate-globals wants to make changes!")
 
-    code |= (fail_fast and code) or xo()
-    code |= (fail_fast and code) or yapf()
-    code |= (fail_fast and code) or flake8(run)
-    code |= (fail_fast and code) or check_kernel_imports(run)
-    code |= (fail_fast and code) or elm_format()
+        return bool(code)
 
-    exit(code)
+    cache = StepCache(run.root_dir, args.cache)
+    tasks = {
+        **elm_make_tasks(run, cache, []),
+        "generate globals": (
+            cache.step(
+                "check generate globals",
+                generate_globals,
+                ["*/src/*.js", "tests/generate-globals.py"],
+            ),
+            [],
+        ),
+        "xo": (cache.step("check xo", xo, ["*.js", "package.json"]), []),
+        "yapf": (
+            cache.step("check yapf", yapf, ["*.py"], YAPF_VERSION),
+            [],
+        ),
+        "flake8": (
+            cache.step(
+                "flake8",
+                functools.partial(flake8, run),
+                ["*.py"],
+                FLAKE8_VERSION,
+            ),
+            [],
+        ),
+        "check kernel imports": (
+            cache.step(
+                "check kernel imports",
+                functools.partial(check_kernel_imports, run),
+                [
+                    *(f"{p}/src/*" for p in PACKAGES),
+                    "tests/check-kernel-imports.js",
+                ],
+            ),
+            [],
+        ),
+        "elm-format": (
+            cache.step(
+                "check elm-format",
+                elm_format,
+                ["core/src/*.elm"],
+                ELM_FORMAT_VERSION,
+            ),
+            [],
+        ),
+    }
+
+    exit(
+        run_tasks(tasks,
+                  jobs=args.jobs,
+                  fail_fast=args.fail_fast,
+                  record=functools.partial(record_history, run.root_dir,
+                                           'check')))
 
 
 def test():
@@ -389,19 +942,127 @@ def test():
 
         return bool(code)
 
-    run(["./init.py"])
+    def gc_test():
+        print("Running the gc test")
+        code = run(['./tests/gc-test.py'])
+
+        if code != 0:
+            print("The gc test failed!")
+
+        return bool(code)
+
+    def init():
+        print("Installing another-elm")
+        code = run(["./init.py"])
+
+        if code != 0:
+            print("Installing another-elm failed!")
+
+        return bool(code)
+
+    # elm-test and elm-test-rs share the elm-stuff directory in tests/.
+    tasks = {
+        "init": (init, []),
+        "elm-test": (elm_test, ["init"]),
+        "elm-test-rs": (elm_test_rs, ["init", "elm-test"]),
+        "vdom tests": (vdom_tests, ["init"]),
+        "browser tests": (browser_tests, ["init"]),
+        "sscce tests": (sscce_tests, ["init"]),
+        "gc test": (gc_test, ["init"]),
+    }
+
+    exit(
+        run_tasks(tasks,
+                  jobs=args.jobs,
+                  fail_fast=args.fail_fast,
+                  record=functools.partial(record_history, run.root_dir,
+                                           'test')))
+
+
+def bench(kind, script, env=None):
+    run = get_runner()
 
-    fail_fast = args.fail_fast
-    code = False
-    code |= (fail_fast and code) or elm_test()
-    code |= (fail_fast and code) or elm_test_rs()
-    code |= (fail_fast and code) or vdom_tests()
-    code |= (fail_fast and code) or browser_tests()
-    code |= (fail_fast and code) or sscce_tests()
+    print(f"Running {kind} benchmarks...")
+    results = os.path.join(run.root_dir, BENCH_DIR, kind, 'latest.json')
+    baseline = os.path.join(run.root_dir, BENCH_DIR, kind, 'baseline.json')
+    code = run(
+        [script, '--output', results, '--baseline', baseline, *extra_args],
+        env=env)
+
+    if code != 0:
+        print(f"The {kind} benchmarks are slower than the baseline!")
+    elif args.save_baseline:
+        shutil.copyfile(results, baseline)
+        print(f"Saved results as the new baseline in {baseline}")
 
     exit(code)
 
 
+def step_samples(runs):
+    """Map the name of each step to its stats in runs (unless cached)."""
+    samples = {}
+    for run in runs:
+        for step in run['steps']:
+            if not step['cached']:
+                samples.setdefault(step['name'], []).append(step)
+    return samples
+
+
+def report():
+    run = get_runner()
+
+    path = os.path.join(run.root_dir, HISTORY)
+    try:
+        with open(path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        print(f"There is no history in {path} yet, x.py tidy, check and test "
+              "write it")
+        exit(1)
+
+    if args.command is not None:
+        entries = [e for e in entries if e['command'] == args.command]
+
+    print("Recent runs:")
+    for entry in entries[-args.runs:]:
+        failed = [step['name'] for step in entry['steps'] if step['exit']]
+        status = f"failed: {', '.join(failed)}" if failed else "ok"
+        print(f"  {entry['time']}  {entry['command']:<5}  "
+              f"{entry['commit']:<10} {format_seconds(entry['wall']):>8}  "
+              f"{status}")
+
+    by_command = {}
+    for entry in entries:
+        by_command.setdefault(entry['command'], []).append(entry)
+
+    rows = []
+    for (command, runs) in by_command.items():
+        recent = step_samples(runs[-args.runs:])
+        previous = step_samples(runs[-2 * args.runs:-args.runs])
+        for (name, samples) in recent.items():
+            wall = statistics.median(step['wall'] for step in samples)
+            change = "-"
+            if name in previous:
+                old = statistics.median(step['wall']
+                                        for step in previous[name])
+                change = f"{wall / old - 1:+.0%}" if old else "-"
+            rows.append((command, name, len(samples), wall,
+                         statistics.median(step['cpu'] for step in samples),
+                         max(step['max_rss'] for step in samples), change))
+
+    print()
+    print(f"Slowest steps (medians of the last {args.runs} runs of each "
+          "command that were not cached, change from the runs before):")
+    width = max([len("step"), *(len(row[1]) for row in rows)])
+    print(f"  {'command':<7} {'step':<{width}} {'runs':>4} {'wall':>8} "
+          f"{'cpu':>8} {'max rss':>8} {'change':>7}")
+    for (command, name, count, wall, cpu, max_rss,
+         change) in sorted(rows, key=lambda row: row[3], reverse=True):
+        print(f"  {command:<7} {name:<{width}} {count:>4} "
+              f"{format_seconds(wall):>8} {format_seconds(cpu):>8} "
+              f"{format_bytes(max_rss):>8} {change:>7}")
+
+
 parser = argparse.ArgumentParser(description='Hack on anther-elm')
 
 subparsers = parser.add_subparsers()
@@ -417,6 +1078,10 @@ tidy_parser = subparsers.add_parser(
     help='tidy files',
 )
 tidy_parser.set_defaults(func=tidy)
+tidy_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+tidy_parser.add_argument('--cache',
+                         action=argparse.BooleanOptionalAction,
+                         default=True)
 
 check_parser = subparsers.add_parser(
     'check',
@@ -424,6 +1089,10 @@ check_parser = subparsers.add_parser(
 )
 check_parser.set_defaults(func=check)
 check_parser.add_argument('--fail-fast', action=argparse.BooleanOptionalAction)
+check_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+check_parser.add_argument('--cache',
+                          action=argparse.BooleanOptionalAction,
+                          default=True)
 
 test_parser = subparsers.add_parser(
     'test',
@@ -431,8 +1100,77 @@ test_parser = subparsers.add_parser(
 )
 test_parser.set_defaults(func=test)
 test_parser.add_argument('--fail-fast', action=argparse.BooleanOptionalAction)
+test_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
 
-args = parser.parse_args()
+bench_parser = subparsers.add_parser(
+    'bench',
+    help='Benchmark compile times of another-elm and elm, other arguments '
+    'are passed to tests/bench-compile.py',
+)
+compile_bench = functools.partial(bench, 'compile', './tests/bench-compile.py')
+bench_parser.set_defaults(func=compile_bench, passes_extra_args=True)
+bench_parser.add_argument('--save-baseline',
+                          action='store_true',
+                          help='Compare future runs with these results')
+
+runtime_bench_parser = subparsers.add_parser(
+    'runtime-bench',
+    help='Benchmark the runtime performance of core kernel code compiled by '
+    'another-elm and elm, other arguments are passed to '
+    'tests/runtime-bench/index.js',
+)
+runtime_bench = functools.partial(bench, 'runtime',
+                                  './tests/runtime-bench/index.js')
+runtime_bench_parser.set_defaults(func=runtime_bench, passes_extra_args=True)
+runtime_bench_parser.add_argument(
+    '--save-baseline',
+    action='store_true',
+    help='Compare future runs with these results')
+
+vdom_bench_parser = subparsers.add_parser(
+    'vdom-bench',
+    help='Benchmark the virtual DOM of another-elm and elm on large trees, '
+    'other arguments are passed to tests/vdom-tests/bench/index.js',
+)
+vdom_bench = functools.partial(bench,
+                               'vdom',
+                               './tests/vdom-tests/bench/index.js',
+                               env={
+                                   "TEST_OFFICIAL_VDOM": "1",
+                                   **os.environ
+                               })
+vdom_bench_parser.set_defaults(func=vdom_bench, passes_extra_args=True)
+vdom_bench_parser.add_argument('--save-baseline',
+                               action='store_true',
+                               help='Compare future runs with these results')
+
+startup_bench_parser = subparsers.add_parser(
+    'startup-bench',
+    help='Measure the import time of the another-elm launcher, other '
+    'arguments are passed to tests/bench-startup.py',
+)
+startup_bench = functools.partial(bench, 'startup', './tests/bench-startup.py')
+startup_bench_parser.set_defaults(func=startup_bench, passes_extra_args=True)
+startup_bench_parser.add_argument(
+    '--save-baseline',
+    action='store_true',
+    help='Compare future runs with these results')
+
+report_parser = subparsers.add_parser(
+    'report',
+    help='Show the slowest steps of recent tidy, check and test runs and how '
+    'their times changed',
+)
+report_parser.set_defaults(func=report)
+report_parser.add_argument('--runs',
+                           type=int,
+                           default=10,
+                           help='Number of recent runs to look at')
+report_parser.add_argument('--command', choices=['tidy', 'check', 'test'])
+
+(args, extra_args) = parser.parse_known_args()
+if extra_args and not getattr(args, 'passes_extra_args', False):
+    parser.error(f"unrecognized arguments: {' '.join(extra_args)}")
 
 try:
     func = args.func